@@ -0,0 +1,214 @@
+#!/usr/bin/env python
+# This file is part of the markdown-svgbob project
+# https://github.com/mbarkhau/markdown-svgbob
+#
+# Copyright (c) 2019-2024 Manuel Barkhau (mbarkhau@gmail.com) - MIT License
+# SPDX-License-Identifier: MIT
+"""Benchmark the render pipeline of markdown_svgbob.
+
+Each stage is measured over synthetic documents with a varying
+number of (distinct) diagrams, first with an empty cache (cold)
+and then again with the same cache (warm).
+
+Usage: python scripts/bench_render.py [--sizes 1,100,5000]
+"""
+import sys
+import time
+import shutil
+import logging
+import argparse
+import tempfile
+import tracemalloc
+import typing as typ
+
+import pathlib2 as pl
+import markdown
+
+from markdown_svgbob import wrapper
+from markdown_svgbob import extension
+from markdown_svgbob.__main__ import TEST_IMAGE
+
+Durations = typ.List[float]
+
+
+def _make_diagrams(num_diagrams: int) -> typ.List[str]:
+    # a trailing label makes each diagram (and its cache key) unique
+    return [TEST_IMAGE.rstrip() + f"\n  diagram {i:05}\n" for i in range(num_diagrams)]
+
+
+def _make_document(diagrams: typ.List[str]) -> str:
+    chunks = [
+        f"## Section {i}\n\nSome text.\n\n```bob\n{diagram}```\n"
+        for i, diagram in enumerate(diagrams)
+    ]
+    return "\n".join(chunks)
+
+
+def _render_markdown(document: str) -> str:
+    return markdown.markdown(document, extensions=['markdown_svgbob'])
+
+
+def _percentile(durations: Durations, pct: float) -> float:
+    ordered = sorted(durations)
+    idx     = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[idx]
+
+
+def _report(name: str, durations: Durations, num_items: int) -> None:
+    total = sum(durations)
+    print(
+        f"{name:<28} {num_items:>6} {total:>9.3f}s {num_items / total:>10.1f}/s"
+        f" {_percentile(durations, 50) * 1000:>9.3f}ms {_percentile(durations, 99) * 1000:>9.3f}ms"
+    )
+
+
+def _timed(func: typ.Callable[..., typ.Any], *args: typ.Any) -> typ.Tuple[float, typ.Any]:
+    t0     = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - t0, result
+
+
+def _reset_caches(cache_dir: pl.Path) -> None:
+    # pending background writes would recreate the cache
+    # directory or fail because it was removed
+    wrapper.flush_disk_cache()
+    if cache_dir.exists():
+        shutil.rmtree(str(cache_dir))
+    wrapper.set_cache_dir(cache_dir)
+    wrapper.SVG_CACHE.clear()
+    extension.HTML_CACHE.clear()
+
+
+def _bench_size(num_diagrams: int, cache_dir: pl.Path) -> None:
+    diagrams = _make_diagrams(num_diagrams)
+    blocks   = ["```bob\n" + diagram + "```" for diagram in diagrams]
+    document = _make_document(diagrams)
+
+    # each stage is run twice, first with an empty cache, then
+    # again with the cache populated by the first run
+    svgs: typ.List[bytes] = []
+    for mode in ["cold", "warm"]:
+        if mode == "cold":
+            _reset_caches(cache_dir)
+        durations: Durations = []
+        svgs = []
+        for diagram in diagrams:
+            duration, svg_data = _timed(wrapper.text2svg, diagram)
+            durations.append(duration)
+            svgs.append(svg_data)
+        _report(f"text2svg ({mode})", durations, num_diagrams)
+
+    for mode in ["cold", "warm"]:
+        if mode == "cold":
+            _reset_caches(cache_dir)
+        durations = [_timed(extension.draw_bob, block)[0] for block in blocks]
+        _report(f"draw_bob ({mode})", durations, num_diagrams)
+
+    for mode in ["cold", "warm"]:
+        if mode == "cold":
+            _reset_caches(cache_dir)
+        duration, _ = _timed(_render_markdown, document)
+        _report(f"markdown ({mode})", [duration], num_diagrams)
+
+    durations = [_timed(extension._postprocess_svg, svg, "red", "green")[0] for svg in svgs]
+    _report("_postprocess_svg", durations, num_diagrams)
+
+    for tag_type in ['inline_svg', 'img_utf8_svg', 'img_base64_svg']:
+        durations = [_timed(extension.svg2html, svg, tag_type)[0] for svg in svgs]
+        _report(f"svg2html ({tag_type})", durations, num_diagrams)
+
+
+def _bench_postprocess_scaling() -> None:
+    # NOTE: The svg is repeated to get large inputs with many style
+    #   matches. Time per KB should be roughly constant (linear).
+    svg_data = wrapper.text2svg(TEST_IMAGE)
+    print()
+    print("_postprocess_svg scaling")
+    print(f"{'size':>10} {'duration':>12} {'per KB':>12}")
+    for repeat in [1, 10, 100, 1000]:
+        large_svg_data = svg_data * repeat
+        durations      = [
+            _timed(extension._postprocess_svg, large_svg_data, "red", "green")[0] for _ in range(5)
+        ]
+        duration = min(durations)
+        size_kb  = len(large_svg_data) / 1024
+        print(f"{size_kb:>8.0f}KB {duration * 1000:>10.3f}ms {duration * 1000 / size_kb:>10.4f}ms")
+
+
+def _bench_minify_size() -> None:
+    diagrams = [TEST_IMAGE] + _make_diagrams(9)
+    document = _make_document(diagrams)
+    print()
+    print("minify output size")
+    print(f"{'input':<28} {'original':>10} {'minified':>10} {'reduction':>10}")
+
+    svg_data = wrapper.text2svg(TEST_IMAGE)
+    min_data = extension._minify_svg(svg_data)
+    _report_size("TEST_IMAGE svg", len(svg_data), len(min_data))
+
+    html     = markdown.markdown(document, extensions=['markdown_svgbob'])
+    min_html = markdown.markdown(
+        document,
+        extensions=['markdown_svgbob'],
+        extension_configs={'markdown_svgbob': {'minify': True}},
+    )
+    _report_size(f"page with {len(diagrams)} diagrams", len(html), len(min_html))
+
+
+def _bench_stream(cache_dir: pl.Path) -> None:
+    # NOTE: The input is written to a file first, so that only the
+    #   memory used by render_stream itself is traced.
+    _reset_caches(cache_dir)
+    diagrams  = _make_diagrams(100)
+    filler    = "Some text.\n" * 10000
+    in_fpath  = cache_dir.parent / "stream_in.md"
+    out_fpath = cache_dir.parent / "stream_out.md"
+    with in_fpath.open(mode="w", encoding="utf-8") as fobj:
+        for diagram in diagrams:
+            fobj.write(filler + "\n```bob\n" + diagram + "```\n")
+
+    size_mb = in_fpath.stat().st_size / (1024 * 1024)
+    print()
+    print("render_stream")
+    tracemalloc.start()
+    with in_fpath.open(mode="r", encoding="utf-8") as in_fobj:
+        with out_fpath.open(mode="w", encoding="utf-8") as out_fobj:
+            duration, _ = _timed(extension.render_stream, in_fobj, out_fobj)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{size_mb:.1f}MB input, {duration:.3f}s, peak memory {peak / (1024 * 1024):.1f}MB")
+
+
+def _report_size(name: str, size: int, min_size: int) -> None:
+    reduction = 100 * (1 - min_size / size)
+    print(f"{name:<28} {size:>10} {min_size:>10} {reduction:>9.1f}%")
+
+
+def main(args: typ.Sequence[str] = sys.argv[1:]) -> int:
+    # pylint:disable=dangerous-default-value   ; mypy will detect if we mutate args
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="1,100,5000", help="Number of diagrams per document")
+    opts = parser.parse_args(args)
+
+    # only errors, so warnings for each diagram don't skew the timings
+    logging.getLogger("markdown_svgbob").setLevel(logging.ERROR)
+
+    tmp_dir = pl.Path(tempfile.mkdtemp(prefix="mdsvgbob_bench_"))
+    try:
+        for size in opts.sizes.split(","):
+            num_diagrams = int(size)
+            print()
+            print(f"{num_diagrams} diagram(s)")
+            header = ["stage".ljust(28), "n".rjust(6), "total".rjust(10), "throughput".rjust(12)]
+            print(" ".join(header + ["p50".rjust(11), "p99".rjust(11)]))
+            _bench_size(num_diagrams, tmp_dir / "cache")
+        _bench_postprocess_scaling()
+        _bench_minify_size()
+        _bench_stream(tmp_dir / "cache")
+    finally:
+        shutil.rmtree(str(tmp_dir))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# This file is part of the markdown-svgbob project
+# https://github.com/mbarkhau/markdown-svgbob
+#
+# Copyright (c) 2019-2024 Manuel Barkhau (mbarkhau@gmail.com) - MIT License
+# SPDX-License-Identifier: MIT
+"""Measure startup time of markdown_svgbob.
+
+Each scenario is run in a fresh interpreter with an empty
+cache directory, so that nothing is reused between runs.
+
+Usage: python scripts/bench_startup.py [runs]
+"""
+import os
+import sys
+import time
+import shutil
+import tempfile
+import statistics
+import subprocess as sp
+
+SCENARIOS = [
+    (
+        "import markdown_svgbob",
+        "import markdown_svgbob",
+    ),
+    (
+        "Markdown(extensions=['markdown_svgbob'])",
+        "import markdown; markdown.Markdown(extensions=['markdown_svgbob'])",
+    ),
+    (
+        "Markdown(...) with svgbob config",
+        (
+            "import markdown; markdown.Markdown("
+            "extensions=['markdown_svgbob'], "
+            "extension_configs={'markdown_svgbob': {'stroke-width': 3}})"
+        ),
+    ),
+    (
+        "Markdown(...) + parse_options (eager)",
+        (
+            "import markdown, markdown_svgbob.wrapper as wrp; "
+            "markdown.Markdown(extensions=['markdown_svgbob']); "
+            "wrp.parse_options()"
+        ),
+    ),
+]
+
+
+def _run_once(code: str) -> float:
+    cache_dir = tempfile.mkdtemp(prefix="mdsvgbob_bench_")
+    env       = dict(os.environ, MDSVGBOB_CACHE_DIR=cache_dir)
+    try:
+        t0 = time.perf_counter()
+        sp.check_call([sys.executable, "-c", code], env=env)
+        return time.perf_counter() - t0
+    finally:
+        shutil.rmtree(cache_dir)
+
+
+def main(args: list) -> int:
+    runs = int(args[0]) if args else 20
+
+    baseline = [_run_once("pass") for _ in range(runs)]
+    print(f"interpreter startup: {statistics.median(baseline) * 1000:7.1f} ms (median)")
+
+    for name, code in SCENARIOS:
+        durations = [_run_once(code) for _ in range(runs)]
+        median_ms = (statistics.median(durations) - statistics.median(baseline)) * 1000
+        print(f"{name:<42}: {median_ms:7.1f} ms (median, without interpreter startup)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -14,8 +14,10 @@ __version__ = "v202406.1023"
 
 
 from markdown_svgbob.wrapper import text2svg
+from markdown_svgbob.wrapper import text2svg_many
 from markdown_svgbob.wrapper import get_bin_path
 from markdown_svgbob.extension import SvgbobExtension
+from markdown_svgbob.extension import render_stream
 
 get_svgbob_bin_path = get_bin_path
 
@@ -29,4 +31,12 @@ def _make_extension(**kwargs) -> SvgbobExtension:
 makeExtension = _make_extension
 
 
-__all__ = ['makeExtension', '__version__', 'get_bin_path', 'get_svgbob_bin_path', 'text2svg']
+__all__ = [
+    'makeExtension',
+    '__version__',
+    'get_bin_path',
+    'get_svgbob_bin_path',
+    'text2svg',
+    'text2svg_many',
+    'render_stream',
+]
@@ -66,9 +66,21 @@ def _selftest() -> ExitCode:
 def main(args: typ.Sequence[str] = sys.argv[1:]) -> ExitCode:
     """Basic wrapper around the svgbob command.
 
-    This is mostly just used for self testing.
+    This is mostly just used for self testing, except for the
+    subcommands `render` and `watch` (see markdown_svgbob.cli).
     """
     # pylint:disable=dangerous-default-value   ; mypy will detect if we mutate args
+    # pylint:disable=import-outside-toplevel  ; lazy import to improve cli responsiveness
+    if args and args[0] == "render":
+        from markdown_svgbob import cli
+
+        return cli.render(args[1:])
+
+    if args and args[0] == "watch":
+        from markdown_svgbob import cli
+
+        return cli.watch(args[1:])
+
     if "--markdown-svgbob-selftest" in args:
         return _selftest()
 
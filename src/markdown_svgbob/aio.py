@@ -0,0 +1,161 @@
+# This file is part of the markdown-svgbob project
+# https://github.com/mbarkhau/markdown-svgbob
+#
+# Copyright (c) 2019-2024 Manuel Barkhau (mbarkhau@gmail.com) - MIT License
+# SPDX-License-Identifier: MIT
+
+# NOTE: This module requires python 3.7+ and is excluded from the
+#   transpilation to python 2.7 (async def can't be transpiled).
+# lib3to6: disabled
+"""asyncio API of markdown_svgbob (requires Python 3.7+).
+
+Images are rendered using asyncio subprocesses, so rendering
+doesn't block the event loop. Results are cached in the same
+caches as wrapper.text2svg and extension.draw_bob.
+"""
+# pylint: disable=protected-access ; shares the internals of wrapper and extension
+
+import time
+import asyncio
+import typing as typ
+import weakref
+
+from markdown_svgbob import process
+from markdown_svgbob import wrapper
+from markdown_svgbob import extension
+
+SvgbobTimeoutException = process.SvgbobTimeoutException
+
+
+# NOTE: A semaphore can only be used by the event loop it was
+#   first used with, so there is one per loop.
+_SEMAPHORES: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = (
+    weakref.WeakKeyDictionary()
+)
+
+# Renders in progress, so that concurrent requests for the
+# same image only start one svgbob process.
+_RENDER_TASKS: typ.Dict[typ.Tuple[int, str], "asyncio.Future[bytes]"] = {}
+
+
+def _get_semaphore() -> asyncio.Semaphore:
+    loop      = asyncio.get_running_loop()
+    semaphore = _SEMAPHORES.get(loop)
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(wrapper.get_pool_size())
+        _SEMAPHORES[loop] = semaphore
+    return semaphore
+
+
+async def _run_svgbob(
+    cmd_parts: typ.List[str], input_data: bytes, timeout: typ.Optional[float]
+) -> bytes:
+    process.check_input_size(input_data)
+    rlimits = process.get_rlimits()
+
+    proc = await asyncio.create_subprocess_exec(
+        *cmd_parts,
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        preexec_fn=process.get_preexec_fn(rlimits),
+    )
+    process.apply_rlimits(proc.pid, rlimits)
+    try:
+        stdout, stderr = await asyncio.wait_for(proc.communicate(input_data), timeout)
+    except asyncio.TimeoutError:
+        proc.kill()
+        await proc.wait()
+        raise process.timeout_error(timeout)
+    except asyncio.CancelledError:
+        proc.kill()
+        await proc.wait()
+        raise
+
+    ret_code = typ.cast(int, proc.returncode)
+    if ret_code < 0:
+        raise process.signal_error(ret_code, rlimits)
+    elif ret_code > 0:
+        raise process.output_error(stdout.decode("utf-8"), stderr.decode("utf-8"))
+    return stdout
+
+
+async def _render_svg(
+    input_data: bytes,
+    backend   : wrapper.Backend,
+    options   : typ.Optional[wrapper.Options],
+    digest    : str,
+    timeout   : typ.Optional[float],
+) -> bytes:
+    async with _get_semaphore():
+        t0 = time.perf_counter()
+        if isinstance(backend, wrapper.SubprocessBackend):
+            cmd_parts = list(wrapper._iter_cmd_parts(options))
+            result    = await _run_svgbob(cmd_parts, input_data, timeout)
+        else:
+            # NOTE: in-process backends would block the event loop
+            loop   = asyncio.get_running_loop()
+            result = await loop.run_in_executor(None, backend.render, input_data, options)
+        wrapper.record_render(input_data, result, time.perf_counter() - t0)
+
+    wrapper.put_disk_cache_async(digest, result)
+    wrapper.SVG_CACHE.put(digest, result)
+    wrapper._cleanup_tmp_dir()
+    return result
+
+
+async def async_text2svg(
+    image_text: str,
+    options   : wrapper.Options = None,
+    timeout   : typ.Optional[float] = None,
+) -> bytes:
+    """Render an image without blocking the event loop.
+
+    Like wrapper.text2svg, raises SvgbobException if svgbob
+    fails and SvgbobTimeoutException after timeout seconds
+    (by default the timeout of wrapper.get_limits()).
+    """
+    if timeout is None:
+        timeout = process.get_limits()['timeout']
+
+    backend    = wrapper.get_backend()
+    input_data = image_text.encode("utf-8")
+    digest     = wrapper._make_digest(input_data, backend.get_id(), options)
+
+    result = wrapper._get_cached_svg(digest)
+    if result is not None:
+        return result
+
+    task_key = (id(asyncio.get_running_loop()), digest)
+    task     = _RENDER_TASKS.get(task_key)
+    if task is None:
+        render = _render_svg(input_data, backend, options, digest, timeout)
+        task   = asyncio.ensure_future(render)
+        _RENDER_TASKS[task_key] = task
+        task.add_done_callback(lambda _: _RENDER_TASKS.pop(task_key, None))
+
+    # NOTE: shield, so that the render isn't cancelled for other
+    #   requests that are waiting on the same task.
+    return await asyncio.shield(task)
+
+
+async def async_draw_bob(
+    block_text     : str,
+    default_options: wrapper.Options = None,
+    timeout        : typ.Optional[float] = None,
+) -> str:
+    """Like extension.draw_bob, without blocking the event loop."""
+    cache_key = None
+    if extension.HTML_CACHE_ENABLED:
+        cache_key = extension._html_cache_key(block_text, default_options)
+        html      = extension._get_cached_html(cache_key)
+        if html is not None:
+            return html
+
+    image_text, options, html_options = extension._parse_block(block_text, default_options)
+    svg_data = await async_text2svg(image_text, options, timeout)
+    html, tag_type = extension._make_html(svg_data, html_options)
+
+    if cache_key is not None:
+        extension._put_cached_html(cache_key, html, tag_type)
+    return html
@@ -0,0 +1,319 @@
+# This file is part of the markdown-svgbob project
+# https://github.com/mbarkhau/markdown-svgbob
+#
+# Copyright (c) 2019-2024 Manuel Barkhau (mbarkhau@gmail.com) - MIT License
+# SPDX-License-Identifier: MIT
+import os
+import re
+import time
+import typing as typ
+import tempfile
+import threading
+import collections
+
+import pathlib2 as pl
+
+DEFAULT_MAX_ENTRIES = 1000
+DEFAULT_MAX_BYTES   = 64 * 1024 * 1024
+
+
+class MemoryCache:
+    """Bounded in-process LRU cache for rendered images.
+
+    Entries are evicted (least recently used first) as soon as
+    either max_entries or max_bytes is exceeded.
+    """
+
+    def __init__(
+        self, max_entries: int = DEFAULT_MAX_ENTRIES, max_bytes: int = DEFAULT_MAX_BYTES
+    ) -> None:
+        self.max_entries = max_entries
+        self.max_bytes   = max_bytes
+
+        self.hits   = 0
+        self.misses = 0
+        self.nbytes = 0
+
+        self._lock    = threading.Lock()
+        self._entries: typ.Dict[str, bytes] = collections.OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._entries
+
+    def get(self, key: str) -> typ.Optional[bytes]:
+        with self._lock:
+            value = self._entries.pop(key, None)
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._entries[key] = value
+            return value
+
+    def put(self, key: str, value: bytes) -> None:
+        if len(value) > self.max_bytes:
+            return
+
+        with self._lock:
+            old_value = self._entries.pop(key, None)
+            if old_value is not None:
+                self.nbytes -= len(old_value)
+
+            self._entries[key] = value
+            self.nbytes += len(value)
+
+            entries = typ.cast(collections.OrderedDict, self._entries)
+            while len(entries) > self.max_entries or self.nbytes > self.max_bytes:
+                _, evicted = entries.popitem(last=False)
+                self.nbytes -= len(evicted)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+            self.hits   = 0
+            self.misses = 0
+
+    def stats(self) -> typ.Dict[str, int]:
+        return {
+            'entries': len(self._entries),
+            'bytes'  : self.nbytes,
+            'hits'   : self.hits,
+            'misses' : self.misses,
+        }
+
+
+DEFAULT_MAX_AGE        = 24 * 60 * 60
+DEFAULT_EVICT_INTERVAL = 60
+
+# (mtime, size)
+IndexEntry = typ.Tuple[float, int]
+
+# Path of a DiskCache entry, relative to the cache directory
+ENTRY_PATH_RE = re.compile(r"^([0-9a-f]{2})/([0-9a-f]{2})/\1\2[0-9a-f]*\.\w+(\.gz)?$")
+
+
+def _iter_entry_paths(cache_dir: pl.Path) -> typ.Iterable[pl.Path]:
+    for fpath in cache_dir.glob("??/??/*"):
+        rel_path = fpath.relative_to(cache_dir).as_posix()
+        if ENTRY_PATH_RE.match(rel_path):
+            yield fpath
+
+
+class EvictionLimits:
+    """Limits of a CacheEvictor, a limit of None is not enforced."""
+
+    def __init__(
+        self,
+        max_age    : float = DEFAULT_MAX_AGE,
+        max_bytes  : typ.Optional[int] = None,
+        max_entries: typ.Optional[int] = None,
+    ) -> None:
+        self.max_age     = max_age
+        self.max_bytes   = max_bytes
+        self.max_entries = max_entries
+
+
+class CacheEvictor:
+    """Evicts files from a cache directory.
+
+    The directory is only scanned once, after that an index of
+    file sizes and access times is maintained via add/touch.
+    Only files in the layout of DiskCache (ab/cd/abcd....svg)
+    are indexed, since the directory may be shared with other
+    files, which must never be evicted.
+    Eviction runs at most once per interval and removes files
+    older than max_age, then the least recently used files until
+    the directory is within max_bytes and max_entries.
+    """
+
+    def __init__(
+        self,
+        cache_dir  : pl.Path,
+        max_age    : float = DEFAULT_MAX_AGE,
+        max_bytes  : typ.Optional[int] = None,
+        max_entries: typ.Optional[int] = None,
+        interval   : float = DEFAULT_EVICT_INTERVAL,
+    ) -> None:
+        self.cache_dir = cache_dir
+        self.limits    = EvictionLimits(max_age, max_bytes, max_entries)
+        self.interval  = interval
+
+        self._lock       = threading.Lock()
+        self._last_evict = 0.0
+        self._index: typ.Optional[typ.Dict[str, IndexEntry]] = None
+
+    def _scan(self) -> typ.Dict[str, IndexEntry]:
+        index: typ.Dict[str, IndexEntry] = {}
+        for fpath in _iter_entry_paths(self.cache_dir):
+            try:
+                stat = fpath.stat()
+            except OSError:
+                continue
+            index[str(fpath)] = (stat.st_mtime, stat.st_size)
+        return index
+
+    def _get_index(self) -> typ.Dict[str, IndexEntry]:
+        if self._index is None:
+            self._index = self._scan()
+        return self._index
+
+    def add(self, fpath: pl.Path, size: int) -> None:
+        with self._lock:
+            self._get_index()[str(fpath)] = (time.time(), size)
+
+    def touch(self, fpath: pl.Path, size: int) -> None:
+        with self._lock:
+            self._get_index()[str(fpath)] = (time.time(), size)
+
+    def maybe_evict(self) -> None:
+        now = time.time()
+        if now - self._last_evict >= self.interval:
+            self.evict(now)
+
+    def _iter_evicted(self, index: typ.Dict[str, IndexEntry], now: float) -> typ.Iterable[str]:
+        limits    = self.limits
+        min_mtime = now - limits.max_age
+        remaining = sorted((mtime, fpath) for fpath, (mtime, _) in index.items())
+
+        nbytes   = sum(size for _, size in index.values())
+        nentries = len(remaining)
+        for mtime, fpath in remaining:
+            is_expired      = mtime < min_mtime
+            is_over_bytes   = limits.max_bytes   is not None and nbytes   > limits.max_bytes
+            is_over_entries = limits.max_entries is not None and nentries > limits.max_entries
+            if not (is_expired or is_over_bytes or is_over_entries):
+                # entries are sorted by mtime, all remaining are newer
+                return
+
+            yield fpath
+            nbytes   -= index[fpath][1]
+            nentries -= 1
+
+    def evict(self, now: typ.Optional[float] = None) -> None:
+        if now is None:
+            now = time.time()
+
+        with self._lock:
+            self._last_evict = now
+
+            index = self._get_index()
+            for fpath in list(self._iter_evicted(index, now)):
+                del index[fpath]
+                try:
+                    os.unlink(fpath)
+                except OSError:
+                    # already removed, probably by another process
+                    pass
+
+
+def _replace(src: str, dst: str) -> None:
+    # NOTE: os.replace is not available on python2, where
+    #   os.rename doesn't overwrite dst on windows.
+    if hasattr(os, 'replace'):
+        os.replace(src, dst)
+        return
+
+    if os.name == 'nt' and os.path.exists(dst):
+        os.unlink(dst)
+    os.rename(src, dst)
+
+
+def _gzip_compress(data: bytes) -> bytes:
+    # pylint: disable=import-outside-toplevel ; lazy import to improve startup time
+    import io
+    import gzip
+
+    # NOTE: gzip.compress is not available on python2
+    buf = io.BytesIO()
+    with gzip.GzipFile(fileobj=buf, mode="wb") as fobj:
+        fobj.write(data)
+    return buf.getvalue()
+
+
+def _gzip_decompress(data: bytes) -> bytes:
+    # pylint: disable=import-outside-toplevel ; lazy import to improve startup time
+    import io
+    import gzip
+
+    with gzip.GzipFile(fileobj=io.BytesIO(data), mode="rb") as fobj:
+        return fobj.read()
+
+
+def write_atomic(fpath: pl.Path, data: bytes) -> None:
+    """Write to a temporary file, then rename it to fpath.
+
+    Readers will either see the previous file or the complete
+    new file, never a partially written one.
+    """
+    fd, tmp_fpath = tempfile.mkstemp(prefix=".tmp_", dir=str(fpath.parent))
+    try:
+        with os.fdopen(fd, "wb") as fobj:
+            fobj.write(data)
+        _replace(tmp_fpath, str(fpath))
+    except Exception:
+        os.unlink(tmp_fpath)
+        raise
+
+
+class DiskCache:
+    """Persistent cache of rendered images.
+
+    Entries are sharded into subdirectories by the first two
+    bytes of their key (ab/cd/abcd....svg), so that no directory
+    becomes too large. Writes go to a temporary file which is
+    then renamed, so concurrent readers (possibly in other
+    processes) never see partially written entries.
+    """
+
+    def __init__(self, cache_dir: pl.Path, suffix: str = ".svg", compress: bool = False) -> None:
+        self.cache_dir = cache_dir
+        self.suffix    = suffix
+        self.compress  = compress
+        self.evictor   = CacheEvictor(cache_dir)
+
+    def path(self, key: str, suffix: typ.Optional[str] = None) -> pl.Path:
+        fname = key + (self.suffix if suffix is None else suffix)
+        if self.compress:
+            fname += ".gz"
+        return self.cache_dir / key[:2] / key[2:4] / fname
+
+    def get(self, key: str, suffix: typ.Optional[str] = None) -> typ.Optional[bytes]:
+        fpath = self.path(key, suffix)
+        try:
+            with fpath.open(mode="rb") as fobj:
+                data = typ.cast(bytes, fobj.read())
+        except IOError:
+            return None
+
+        if not data:
+            # never a valid entry, writes are atomic
+            return None
+
+        try:
+            os.utime(str(fpath), None)
+        except OSError:
+            # NOTE: Evicted in the meantime, probably by another
+            #   process. Unlike fpath.touch(), this doesn't create
+            #   an empty file in its place.
+            pass
+        self.evictor.touch(fpath, len(data))
+
+        if self.compress:
+            return _gzip_decompress(data)
+        else:
+            return data
+
+    def put(self, key: str, data: bytes, suffix: typ.Optional[str] = None) -> None:
+        fpath = self.path(key, suffix)
+        # NOTE: pathlib2 supports exist_ok also on python2
+        fpath.parent.mkdir(parents=True, exist_ok=True)
+
+        if self.compress:
+            data = _gzip_compress(data)
+
+        write_atomic(fpath, data)
+        self.evictor.add(fpath, len(data))
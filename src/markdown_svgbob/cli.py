@@ -0,0 +1,392 @@
+# This file is part of the markdown-svgbob project
+# https://github.com/mbarkhau/markdown-svgbob
+#
+# Copyright (c) 2019-2024 Manuel Barkhau (mbarkhau@gmail.com) - MIT License
+# SPDX-License-Identifier: MIT
+"""Subcommands of `python -m markdown_svgbob`."""
+import os
+import sys
+import glob
+import time
+import typing as typ
+import logging
+import argparse
+
+import pathlib2 as pl
+import markdown
+
+from markdown_svgbob import wrapper
+from markdown_svgbob import extension
+
+logger = logging.getLogger(__name__)
+
+
+ExitCode = int
+
+# (input path, output path)
+RenderJob = typ.Tuple[pl.Path, pl.Path]
+
+
+def _glob(pattern: str) -> typ.List[str]:
+    try:
+        return glob.glob(pattern, recursive=True)
+    except TypeError:
+        # python2: no recursive glob, ** is the same as *
+        return glob.glob(pattern)
+
+
+def _iter_input_paths(patterns: typ.Sequence[str], quiet: bool = False) -> typ.Iterable[pl.Path]:
+    for pattern in patterns:
+        fpaths = sorted(_glob(pattern))
+        if not fpaths:
+            if glob.has_magic(pattern):
+                # not an error, files may be added later (see Watcher)
+                if not quiet:
+                    logger.warning(f"No files match {pattern}")
+                continue
+            # a literal path, which render reports if it is missing
+            fpaths = [pattern]
+
+        for fpath in fpaths:
+            path = pl.Path(fpath)
+            if path.is_dir():
+                continue
+            elif path.suffix in (".bob", ".md"):
+                yield path
+            elif not quiet:
+                logger.warning(f"Ignoring {fpath}, expected a .bob or .md file")
+
+
+def _output_path(input_path: pl.Path, out_dir: typ.Optional[pl.Path]) -> pl.Path:
+    suffix = ".svg" if input_path.suffix == ".bob" else ".html"
+    if out_dir is None:
+        return input_path.with_suffix(suffix)
+
+    rel_path = os.path.relpath(str(input_path))
+    if rel_path.startswith(".."):
+        rel_path = input_path.name
+    return (out_dir / rel_path).with_suffix(suffix)
+
+
+def _is_up_to_date(input_path: pl.Path, output_path: pl.Path) -> bool:
+    try:
+        return bool(output_path.stat().st_mtime >= input_path.stat().st_mtime)
+    except OSError:
+        return False
+
+
+def _read_text(fpath: pl.Path) -> str:
+    with fpath.open(mode="r", encoding="utf-8") as fobj:
+        return typ.cast(str, fobj.read())
+
+
+def _write_output(output_path: pl.Path, data: bytes) -> None:
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    with output_path.open(mode="wb") as fobj:
+        fobj.write(data)
+
+
+def _render_bob_files(jobs: typ.List[RenderJob]) -> int:
+    # NOTE: All .bob files are rendered in one batch, so that they
+    #   are rendered concurrently and identical ones only once.
+    image_texts: typ.List[str] = []
+    for input_path, _ in jobs:
+        image_texts.append(_read_text(input_path))
+
+    num_failed = 0
+    try:
+        svgs = wrapper.text2svg_many(image_texts)
+    except wrapper.SvgbobException:
+        # render one by one, to find out which file failed
+        svgs = []
+        for (input_path, _), image_text in zip(jobs, image_texts):
+            try:
+                svgs.append(wrapper.text2svg(image_text))
+            except wrapper.SvgbobException as ex:
+                logger.error(f"Error rendering {input_path}: {ex}")
+                svgs.append(b"")
+                num_failed += 1
+
+    for (_, output_path), svg_data in zip(jobs, svgs):
+        if svg_data:
+            _write_output(output_path, svg_data)
+    return num_failed
+
+
+def _iter_md_blocks(md_text: str) -> typ.Iterable[str]:
+    # same as SvgbobPreprocessor, which gets the lines of md_text
+    for chunk in extension.iter_fence_chunks(md_text.split("\n")):
+        if not isinstance(chunk, str):
+            yield "\n".join(chunk).rstrip()
+
+
+def _prerender_blocks(converter: markdown.Markdown, block_texts: typ.Sequence[str]) -> None:
+    preproc = typ.cast(
+        extension.SvgbobPreprocessor, converter.preprocessors['svgbob_fenced_code_block']
+    )
+    futures = [
+        wrapper.submit(extension.draw_bob, block_text, preproc.default_options)
+        for block_text in block_texts
+    ]
+    for future in futures:
+        try:
+            future.result()
+        except wrapper.SvgbobException:
+            # reported by the conversion of the file
+            pass
+
+
+def _render_md_files(jobs: typ.List[RenderJob], options: typ.Dict[str, typ.Any]) -> int:
+    md_texts = [_read_text(input_path) for input_path, _ in jobs]
+
+    md_ext    = extension.SvgbobExtension(**options)
+    converter = markdown.Markdown(extensions=[md_ext])
+
+    # NOTE: The blocks of all files are rendered concurrently first,
+    #   converting each file after that only hits the cache.
+    block_texts = {block for md_text in md_texts for block in _iter_md_blocks(md_text)}
+    _prerender_blocks(converter, sorted(block_texts))
+
+    num_failed = 0
+    for (input_path, output_path), md_text in zip(jobs, md_texts):
+        try:
+            md_ext.set_page(str(input_path))
+            html = converter.reset().convert(md_text)
+        except wrapper.SvgbobException as ex:
+            logger.error(f"Error rendering {input_path}: {ex}")
+            num_failed += 1
+        else:
+            _write_output(output_path, html.encode("utf-8"))
+    return num_failed
+
+
+def _option_arg(arg: str) -> typ.Tuple[str, str]:
+    name, sep, value = arg.partition("=")
+    if not (name and sep):
+        raise argparse.ArgumentTypeError(f"invalid option '{arg}', expected NAME=VALUE")
+    return (name, value)
+
+
+def _parse_render_args(args: typ.Sequence[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="python -m markdown_svgbob render",
+        description="Render .bob files to .svg and .md files to .html",
+    )
+    parser.add_argument(
+        "patterns", nargs="+", help="Input files or glob patterns (** is supported)"
+    )
+    parser.add_argument(
+        "-j", "--jobs", type=int, default=None, help="Number of parallel svgbob processes"
+    )
+    parser.add_argument(
+        "-o", "--out-dir", default=None, help="Output directory (default: next to the input)"
+    )
+    parser.add_argument(
+        "-f", "--force", action="store_true", help="Render even if the output is up to date"
+    )
+    parser.add_argument(
+        "--option",
+        action="append",
+        default=[],
+        type=_option_arg,
+        metavar="NAME=VALUE",
+        help="Extension option for .md files, e.g. --option tag_type=img_base64_svg",
+    )
+    return parser.parse_args(args)
+
+
+def render(args: typ.Sequence[str]) -> ExitCode:
+    opts = _parse_render_args(args)
+    if opts.jobs is not None:
+        wrapper.set_pool_size(opts.jobs)
+
+    options = dict(opts.option)
+    out_dir = None if opts.out_dir is None else pl.Path(opts.out_dir)
+
+    t0 = time.time()
+
+    bob_jobs: typ.List[RenderJob] = []
+    md_jobs : typ.List[RenderJob] = []
+
+    num_skipped = 0
+    for input_path in _iter_input_paths(opts.patterns):
+        output_path = _output_path(input_path, out_dir)
+        if not input_path.exists():
+            logger.error(f"No such file: {input_path}")
+            return 1
+        elif not opts.force and _is_up_to_date(input_path, output_path):
+            num_skipped += 1
+        elif input_path.suffix == ".bob":
+            bob_jobs.append((input_path, output_path))
+        else:
+            md_jobs.append((input_path, output_path))
+
+    num_failed = 0
+    if bob_jobs:
+        num_failed += _render_bob_files(bob_jobs)
+    if md_jobs:
+        num_failed += _render_md_files(md_jobs, options)
+
+    wrapper.flush_disk_cache()
+
+    duration     = time.time() - t0
+    num_rendered = len(bob_jobs) + len(md_jobs) - num_failed
+    print(
+        f"{num_rendered} file(s) rendered, {num_skipped} up to date, "
+        f"{num_failed} failed in {duration:.2f}s",
+        file=sys.stderr,
+    )
+    return 1 if num_failed else 0
+
+
+# (mtime, size)
+FileStamp = typ.Tuple[float, int]
+
+
+def _file_stamp(path: pl.Path) -> typ.Optional[FileStamp]:
+    try:
+        stat = path.stat()
+    except OSError:
+        return None
+    return (stat.st_mtime, stat.st_size)
+
+
+class WatchedFile:
+    """State of a file that is watched for changes."""
+
+    def __init__(self) -> None:
+        self.stamp     : typ.Optional[FileStamp] = None
+        self.changed_at: typ.Optional[float] = None
+        # bob blocks of the previous render
+        self.blocks: typ.Set[str] = set()
+
+
+class Watcher:
+    """Polls files for changes and renders them again.
+
+    A changed file is only rendered once it was unchanged for
+    debounce seconds, so that rapid edits are rendered once. Of
+    the bob blocks of a .md file, only those which are new since
+    the previous render of the file are rendered, the others are
+    served from the cache.
+    """
+
+    def __init__(
+        self,
+        patterns: typ.Sequence[str],
+        out_dir : typ.Optional[pl.Path] = None,
+        options : typ.Optional[typ.Dict[str, typ.Any]] = None,
+        debounce: float = 0.1,
+    ) -> None:
+        self.patterns = patterns
+        self.out_dir  = out_dir
+        self.debounce = debounce
+
+        self.md_ext    = extension.SvgbobExtension(**(options or {}))
+        self.converter = markdown.Markdown(extensions=[self.md_ext])
+
+        self._num_polls = 0
+        self._files: typ.Dict[pl.Path, WatchedFile] = {}
+
+    def poll(self, now: typ.Optional[float] = None) -> typ.List[str]:
+        """Check all files and render those that changed.
+
+        Returns a report line for each rendered file.
+        """
+        if now is None:
+            now = time.time()
+
+        quiet = self._num_polls > 0
+        self._num_polls += 1
+        for path in _iter_input_paths(self.patterns, quiet=quiet):
+            stamp   = _file_stamp(path)
+            watched = self._files.setdefault(path, WatchedFile())
+            if stamp is not None and stamp != watched.stamp:
+                watched.stamp      = stamp
+                watched.changed_at = now
+
+        reports = []
+        for path in sorted(self._files):
+            watched = self._files[path]
+            if watched.changed_at is not None and now - watched.changed_at >= self.debounce:
+                watched.changed_at = None
+                reports.append(self._render(path, watched))
+        return reports
+
+    def _render(self, path: pl.Path, watched: WatchedFile) -> str:
+        t0 = time.time()
+
+        output_path = _output_path(path, self.out_dir)
+        try:
+            text = _read_text(path)
+            if path.suffix == ".bob":
+                block_texts = {text}
+                new_blocks  = block_texts - watched.blocks
+                output_data = wrapper.text2svg(text)
+            else:
+                block_texts = set(_iter_md_blocks(text))
+                new_blocks  = block_texts - watched.blocks
+                _prerender_blocks(self.converter, sorted(new_blocks))
+                self.md_ext.set_page(str(path))
+                output_data = self.converter.reset().convert(text).encode("utf-8")
+        except (IOError, wrapper.SvgbobException) as ex:
+            return f"{path}: error {ex}"
+
+        _write_output(output_path, output_data)
+        watched.blocks = block_texts
+
+        duration_ms = (time.time() - t0) * 1000
+        return (
+            f"{path}: {len(new_blocks)} of {len(block_texts)} diagram(s) rendered"
+            f" in {duration_ms:.1f} ms"
+        )
+
+
+def _parse_watch_args(args: typ.Sequence[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="python -m markdown_svgbob watch",
+        description="Render .bob and .md files (like render) whenever they change",
+    )
+    parser.add_argument(
+        "patterns", nargs="+", help="Input files or glob patterns (** is supported)"
+    )
+    parser.add_argument(
+        "-o", "--out-dir", default=None, help="Output directory (default: next to the input)"
+    )
+    parser.add_argument(
+        "--interval", type=float, default=0.2, help="Seconds between checks for changes"
+    )
+    parser.add_argument(
+        "--debounce",
+        type=float,
+        default=0.1,
+        help="Seconds a file must be unchanged before it is rendered",
+    )
+    parser.add_argument(
+        "--option",
+        action="append",
+        default=[],
+        type=_option_arg,
+        metavar="NAME=VALUE",
+        help="Extension option for .md files, e.g. --option tag_type=img_base64_svg",
+    )
+    return parser.parse_args(args)
+
+
+def watch(args: typ.Sequence[str]) -> ExitCode:
+    opts    = _parse_watch_args(args)
+    options = dict(opts.option)
+    out_dir = None if opts.out_dir is None else pl.Path(opts.out_dir)
+    watcher = Watcher(opts.patterns, out_dir, options, opts.debounce)
+
+    print(f"Watching {' '.join(opts.patterns)}, press Ctrl-C to stop", file=sys.stderr)
+    try:
+        while True:
+            for report in watcher.poll():
+                print(report, file=sys.stderr)
+            time.sleep(opts.interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        wrapper.flush_disk_cache()
+    return 0
@@ -3,6 +3,7 @@
 #
 # Copyright (c) 2019-2024 Manuel Barkhau (mbarkhau@gmail.com) - MIT License
 # SPDX-License-Identifier: MIT
+import os
 import re
 import copy
 import json
@@ -10,12 +11,22 @@ import base64
 import typing as typ
 import hashlib
 import logging
+import collections
+
+import pathlib2 as pl
 
 from markdown.extensions import Extension
 from markdown.preprocessors import Preprocessor
 from markdown.postprocessors import Postprocessor
 
+from markdown_svgbob import cache
 from markdown_svgbob import wrapper
+from markdown_svgbob import metrics
+from markdown_svgbob import manifest
+
+if typ.TYPE_CHECKING:
+    # pylint: disable=unused-import ; only used in annotations
+    from concurrent.futures import Future
 
 try:
     from urllib.parse import quote
@@ -43,13 +54,60 @@ def make_marker_id(text: str) -> str:
     return hashlib.md5(data).hexdigest()
 
 
-# TagType enumeration: inline_svg|img_utf8_svg|img_base64_svg
+def _make_marker_tag(img_id: str) -> str:
+    return f"<p id=\"tmp_md_svgbob{img_id}\">svgbob{img_id}</p>"
+
+
+# Matches a marker tag, including the <p> wrapper that markdown
+# may have added around it (only if it is also closed).
+MARKER_RE = re.compile(
+    r'(?P<wrap><p>)?<p id="tmp_md_svgbob(?P<id>[0-9a-f]{32})">svgbob(?P=id)</p>(?(wrap)</p>)'
+)
+
+
+# TagType enumeration: inline_svg|img_utf8_svg|img_base64_svg|img_file
 TagType = str
 
 
-def svg2html(svg_data: bytes, tag_type: TagType = 'inline_svg') -> str:
+SVG_ROOT_RE = re.compile(r"<svg\b[^>]*>")
+SVG_SIZE_RE = re.compile(r"\s(?:width|height)=\"[^\"]*\"")
+
+
+def _get_size_attrs(svg_text: str) -> str:
+    root_match = SVG_ROOT_RE.search(svg_text)
+    if root_match is None:
+        return ""
+    else:
+        return "".join(SVG_SIZE_RE.findall(root_match.group(0)))
+
+
+def _write_img_file(svg_data: bytes, img_dir: str, img_url: str) -> str:
+    # NOTE: Files are named by the hash of their content, so they
+    #   can be cached indefinitely by browsers and CDNs, and are
+    #   only written once, even if they are used on multiple pages.
+    fname = hashlib.sha256(svg_data).hexdigest()[:32] + ".svg"
+    fpath = pl.Path(img_dir) / fname
+    if not fpath.exists():
+        fpath.parent.mkdir(parents=True, exist_ok=True)
+        cache.write_atomic(fpath, svg_data)
+
+    if img_url:
+        return img_url.rstrip("/") + "/" + fname
+    else:
+        return fname
+
+
+def svg2html(
+    svg_data: bytes, tag_type: TagType = 'inline_svg', img_dir: str = "", img_url: str = ""
+) -> str:
     svg_data = svg_data.replace(b"\n", b"")
-    if tag_type == 'img_base64_svg':
+    if tag_type == 'img_file':
+        if not img_dir:
+            raise ValueError("Option img_dir is required for tag_type='img_file'")
+        img_src    = _write_img_file(svg_data, img_dir, img_url)
+        size_attrs = _get_size_attrs(svg_data.decode("utf-8"))
+        return f'<img class="bob" src="{img_src}"{size_attrs} loading="lazy"/>'
+    elif tag_type == 'img_base64_svg':
         img_b64_data: bytes = base64.standard_b64encode(svg_data)
         img_text = img_b64_data.decode('ascii')
         return f'<img class="bob" src="data:image/svg+xml;base64,{img_text}"/>'
@@ -87,54 +145,99 @@ def _add_char_padding(block_text: str, min_width: int) -> str:
 
 
 # https://regex101.com/r/BQkg5t/2/
-BG_STYLE_PATTERN = r"""
-(
+# NOTE: Styles with the default background (white) and foreground
+#   (black) colors, so that both can be replaced in a single pass.
+#   The alternatives are not wrapped in (named) groups, as that
+#   prevents the regex engine from quickly skipping positions
+#   that can't match.
+STYLE_PATTERN = r"""
   rect\.backdrop\s*\{\s*fill:\s*white;
 | \.bg_fill\s*\{\s*fill:\s*white;
-| </style><rect fill="white"
-)
-"""
-BG_STYLE_RE = re.compile(BG_STYLE_PATTERN.encode("ascii"), flags=re.VERBOSE)
-
-FG_STYLE_PATTERN = r"""
-(
-  \.fg_stroke\s*\{\s*stroke:\s*black;
+| </style><rect[ ]fill="white"
+| \.fg_stroke\s*\{\s*stroke:\s*black;
 | \.fg_fill\s*\{\s*fill:\s*black;
 | text\s*{\s*fill:\s*black;
-)
 """
-FG_STYLE_RE = re.compile(FG_STYLE_PATTERN.encode("ascii"), flags=re.VERBOSE)
+STYLE_RE = re.compile(STYLE_PATTERN.encode("ascii"), flags=re.VERBOSE)
 
 
 def _postprocess_svg(svg_data: bytes, bg_color: str = None, fg_color: str = None) -> bytes:
+    replacements: typ.List[typ.Tuple[bytes, bytes]] = []
     if bg_color:
-        pos = 0
-        while True:
-            match = BG_STYLE_RE.search(svg_data, pos)
-            if match is None:
-                break
+        replacements.append((b"white", bg_color.encode("ascii")))
+    if fg_color:
+        replacements.append((b"black", fg_color.encode("ascii")))
 
-            repl = match.group(0).replace(b"white", bg_color.encode("ascii"))
-            begin, end = match.span()
-            pos      = end
-            svg_data = svg_data[:begin] + repl + svg_data[end:]
+    if not replacements:
+        return svg_data
 
-    if fg_color:
-        pos = 0
-        while True:
-            match = FG_STYLE_RE.search(svg_data, pos)
-            if match is None:
-                break
+    def _repl(match: typ.Match[bytes]) -> bytes:
+        style = match.group(0)
+        for default_color, color in replacements:
+            if default_color in style:
+                return style.replace(default_color, color)
+        return style
+
+    return STYLE_RE.sub(_repl, svg_data)
 
-            repl = match.group(0).replace(b"black", fg_color.encode("ascii"))
-            begin, end = match.span()
-            pos      = end
-            svg_data = svg_data[:begin] + repl + svg_data[end:]
 
+# Number of decimal places of coordinates in minified svg
+MINIFY_PRECISION = 2
+
+SVG_TAG_RE = re.compile(rb"<[^>]+>")
+
+# Attributes with coordinates and sizes, other numbers in a tag
+# (e.g. version="1.0") are not rounded.
+SVG_COORD_ATTR_RE = re.compile(
+    rb'(?<=\s)(?:[xy][12]?|c[xy]|r[xy]?|width|height|d|points|viewBox)="[^"]*"'
+)
+
+SVG_NUMBER_RE = re.compile(rb"-?\d+\.\d+")
+SVG_STYLE_RE  = re.compile(rb"(<style[^>]*>)(.*?)(</style>)", flags=re.DOTALL)
+
+CSS_SPACE_RE = re.compile(rb"\s+")
+CSS_SEP_RE   = re.compile(rb" ?([{};,]) ?")
+
+
+def _round_number(match: typ.Match[bytes]) -> bytes:
+    num_text = f"{float(match.group(0)):.{MINIFY_PRECISION}f}"
+    if "." in num_text:
+        num_text = num_text.rstrip("0").rstrip(".")
+    if num_text == "-0":
+        num_text = "0"
+    return num_text.encode("ascii")
+
+
+def _minify_attr(match: typ.Match[bytes]) -> bytes:
+    return SVG_NUMBER_RE.sub(_round_number, match.group(0))
+
+
+def _minify_tag(match: typ.Match[bytes]) -> bytes:
+    return SVG_COORD_ATTR_RE.sub(_minify_attr, match.group(0))
+
+
+def _minify_style(match: typ.Match[bytes]) -> bytes:
+    css = CSS_SPACE_RE.sub(b" ", match.group(2))
+    css = CSS_SEP_RE.sub(rb"\1", css).replace(b": ", b":")
+    return match.group(1) + css.strip() + match.group(3)
+
+
+def _minify_svg(svg_data: bytes) -> bytes:
+    # NOTE: Numbers are only rounded inside of tags, so that the
+    #   content of <text> elements is preserved.
+    svg_data = SVG_TAG_RE.sub(_minify_tag, svg_data)
+    svg_data = SVG_STYLE_RE.sub(_minify_style, svg_data)
     return svg_data
 
 
-def draw_bob(block_text: str, default_options: wrapper.Options = None) -> str:
+# Options which are used by _make_html rather than passed to svgbob
+HTML_OPTION_KEYS = ('tag_type', 'img_dir', 'img_url', 'bg_color', 'fg_color', 'minify')
+
+
+def _parse_block(
+    block_text: str, default_options: wrapper.Options = None
+) -> typ.Tuple[str, wrapper.Options, wrapper.Options]:
+    """Parse a block into image text, svgbob options and html options."""
     options: wrapper.Options = {}
 
     if default_options:
@@ -150,42 +253,366 @@ def draw_bob(block_text: str, default_options: wrapper.Options = None) -> str:
     if min_char_width:
         block_text = _add_char_padding(block_text, min_char_width)
 
-    tag_type = typ.cast(str, options.pop('tag_type', 'inline_svg'))
+    html_options = {key: options.pop(key) for key in HTML_OPTION_KEYS if key in options}
+    return (block_text, options, html_options)
 
-    bg_color = options.pop("bg_color", "")
-    fg_color = options.pop("fg_color", "")
+
+def _make_html(svg_data: bytes, html_options: wrapper.Options) -> typ.Tuple[str, TagType]:
+    tag_type = typ.cast(str, html_options.get('tag_type', 'inline_svg'))
+    img_dir  = str(html_options.get('img_dir', ""))
+    img_url  = str(html_options.get('img_url', ""))
+
+    bg_color = html_options.get("bg_color", "")
+    fg_color = html_options.get("fg_color", "")
     if not isinstance(bg_color, str):
         bg_color = ""
     if not isinstance(fg_color, str):
         fg_color = ""
 
-    svg_data = wrapper.text2svg(block_text, options)
-    svg_data = _postprocess_svg(svg_data  , bg_color, fg_color)
+    minify = html_options.get('minify', False) in (True, "true", "True", "1")
+
+    with metrics.METRICS.timed("postprocess_svg"):
+        svg_data = _postprocess_svg(svg_data, bg_color, fg_color)
+    if minify:
+        with metrics.METRICS.timed("minify_svg"):
+            svg_data = _minify_svg(svg_data)
+
+    with metrics.METRICS.timed("svg2html"):
+        html = svg2html(svg_data, tag_type, img_dir, img_url)
+    return (html, tag_type)
+
 
-    return svg2html(svg_data, tag_type=tag_type)
+def _draw_bob(block_text: str, default_options: wrapper.Options = None) -> typ.Tuple[str, TagType]:
+    image_text, options, html_options = _parse_block(block_text, default_options)
+    svg_data = wrapper.text2svg(image_text, options)
+    return _make_html(svg_data, html_options)
 
 
-DEFAULT_CONFIG = {
-    'tag_type'      : ["inline_svg", "Format to use (inline_svg|img_utf8_svg|img_base64_svg)"],
+# NOTE: The html output of draw_bob is cached in addition to the
+#   svg output of svgbob, so that a warm cache skips option parsing,
+#   postprocessing and encoding. This can be disabled by setting
+#   MDSVGBOB_HTML_CACHE=0.
+HTML_CACHE_ENABLED = os.environ.get('MDSVGBOB_HTML_CACHE', "1") != "0"
+
+HTML_CACHE = cache.MemoryCache()
+
+# NOTE: Part of the key of the html cache, which may be shared
+#   between builds and versions of markdown_svgbob. This must be
+#   changed whenever the html for the same svg changes (e.g. its
+#   postprocessing, minification or encoding).
+HTML_CACHE_VERSION = "2"
+
+
+def _html_cache_key(block_text: str, default_options: wrapper.Options = None) -> str:
+    options_text = json.dumps(default_options or {}, sort_keys=True)
+    hasher       = hashlib.sha256(HTML_CACHE_VERSION.encode("ascii"))
+    hasher.update(b"\x00" + block_text.encode("utf-8"))
+    hasher.update(b"\x00" + options_text.encode("utf-8"))
+    hasher.update(b"\x00" + wrapper.get_backend().get_id().encode("utf-8"))
+    return hasher.hexdigest()
+
+
+def _get_cached_html(cache_key: str) -> typ.Optional[str]:
+    html_data = HTML_CACHE.get(cache_key)
+    metrics.METRICS.count_lookup("html_cache.memory", html_data is not None)
+    if html_data is None:
+        html_data = wrapper.DISK_CACHE.get(cache_key, suffix=".html")
+        metrics.METRICS.count_lookup("html_cache.disk", html_data is not None)
+        if html_data is None:
+            return None
+        HTML_CACHE.put(cache_key, html_data)
+    return html_data.decode("utf-8")
+
+
+def _put_cached_html(cache_key: str, html: str, tag_type: TagType) -> None:
+    if tag_type == 'img_file':
+        # not cached, so that the file is written again
+        # if the output directory was cleaned in the meantime
+        return
+
+    html_data = html.encode("utf-8")
+    wrapper.DISK_CACHE.put(cache_key, html_data, suffix=".html")
+    HTML_CACHE.put(cache_key, html_data)
+
+
+def draw_bob(block_text: str, default_options: wrapper.Options = None) -> str:
+    with metrics.METRICS.timed("draw_bob"):
+        return _draw_bob_cached(block_text, default_options)
+
+
+def _draw_bob_cached(block_text: str, default_options: wrapper.Options = None) -> str:
+    if not HTML_CACHE_ENABLED:
+        return _draw_bob(block_text, default_options)[0]
+
+    cache_key = _html_cache_key(block_text, default_options)
+    html      = _get_cached_html(cache_key)
+    if html is None:
+        html, tag_type = _draw_bob(block_text, default_options)
+        _put_cached_html(cache_key, html, tag_type)
+    return html
+
+
+def draw_bob_many(
+    block_texts: typ.Sequence[str], default_options: wrapper.Options = None
+) -> typ.List[str]:
+    """Render multiple blocks concurrently on the worker pool."""
+    if len(block_texts) == 1:
+        return [draw_bob(block_texts[0], default_options)]
+
+    # NOTE: The backend (and the id of the svgbob binary) are
+    #   looked up here once, rather than by each pool worker.
+    wrapper.get_backend().get_id()
+
+    futures = [
+        wrapper.submit(draw_bob, block_text, default_options) for block_text in block_texts
+    ]
+    return [future.result() for future in futures]
+
+
+# A chunk is either a line outside of any bob block or the
+# list of lines of a complete bob block (including its fences).
+FenceChunk = typ.Union[str, typ.List[str]]
+
+
+def iter_fence_chunks(lines: typ.Iterable[str]) -> typ.Iterable[FenceChunk]:
+    """Split lines into bob blocks and other lines.
+
+    Lines are consumed lazily, so lines may be a file object.
+    The lines of an unterminated block are passed through as
+    they are.
+    """
+    is_in_fence          = False
+    expected_close_fence = "```"
+
+    block_lines: typ.List[str] = []
+
+    for line in lines:
+        if is_in_fence:
+            block_lines.append(line)
+            is_ending_fence = line.strip() == expected_close_fence
+            if not is_ending_fence:
+                continue
+
+            is_in_fence = False
+            yield block_lines
+            block_lines = []
+        else:
+            fence_match = BLOCK_START_RE.match(line)
+            if fence_match:
+                is_in_fence          = True
+                expected_close_fence = fence_match.group(1)
+                block_lines.append(line)
+            else:
+                yield line
+
+    for line in block_lines:
+        yield line
+
+
+# Upper bound for lines that are buffered while waiting for the
+# rendering of a previous block to finish.
+MAX_PENDING_LINES = 10000
+
+PendingItem = typ.Union[str, "Future[str]"]
+
+
+def _write_pending(
+    pending: typ.Deque[PendingItem], out_fobj: typ.TextIO, num_wait: int = 0
+) -> int:
+    # Writes items in order of the input. Blocks until the first
+    # num_wait blocks are rendered, after that only blocks that
+    # are already done are written. Returns the number of blocks
+    # that were written.
+    num_written = 0
+    while pending:
+        item = pending[0]
+        if isinstance(item, str):
+            out_fobj.write(item)
+        elif num_written < num_wait or item.done():
+            out_fobj.write(item.result() + "\n")
+            num_written += 1
+        else:
+            break
+        pending.popleft()
+    return num_written
+
+
+def render_stream(
+    in_fobj    : typ.TextIO,
+    out_fobj   : typ.TextIO,
+    options    : wrapper.Options = None,
+    max_pending: typ.Optional[int] = None,
+) -> int:
+    """Copy in_fobj to out_fobj, replacing bob blocks with html.
+
+    The input is processed line by line, so memory use does not
+    depend on the size of the input. At most max_pending blocks
+    (by default twice the pool size) are rendered concurrently,
+    the output is written in the order of the input.
+
+    Returns the number of blocks that were rendered.
+    """
+    if max_pending is None:
+        max_pending = 2 * wrapper.get_pool_size()
+
+    pending: typ.Deque[PendingItem] = collections.deque()
+
+    num_blocks  = 0
+    num_futures = 0
+    for chunk in iter_fence_chunks(in_fobj):
+        if isinstance(chunk, str):
+            if pending:
+                pending.append(chunk)
+            else:
+                out_fobj.write(chunk)
+        else:
+            block_text = "\n".join(line.rstrip("\r\n") for line in chunk).rstrip()
+            pending.append(wrapper.submit(draw_bob, block_text, options))
+            num_blocks  += 1
+            num_futures += 1
+
+        if len(pending) > MAX_PENDING_LINES:
+            num_wait = 1
+        else:
+            num_wait = max(0, num_futures - max_pending)
+        num_futures -= _write_pending(pending, out_fobj, num_wait)
+
+    _write_pending(pending, out_fobj, num_wait=num_futures)
+    return num_blocks
+
+
+def _manifest_block_key(block_text: str, options_key: str) -> str:
+    return make_marker_id(options_key + block_text)
+
+
+def _put_manifest_html(
+    block_text: str, default_options: wrapper.Options, cache_key: str, html: str
+) -> None:
+    html_options = _parse_block(block_text, default_options)[2]
+    tag_type     = typ.cast(str, html_options.get('tag_type', 'inline_svg'))
+    _put_cached_html(cache_key, html, tag_type)
+
+
+def _get_manifest_html(
+    page_manifest: manifest.Manifest, entry: manifest.BlockEntry
+) -> typ.Optional[str]:
+    # NOTE: If the html cache is disabled, its entries are only
+    #   written for the manifest, so only blocks in the manifest
+    #   are read from it.
+    block_key, cache_key = entry
+    if HTML_CACHE_ENABLED or page_manifest.lookup(block_key) == cache_key:
+        return _get_cached_html(cache_key)
+    else:
+        return None
+
+
+def _draw_bob_with_manifest(
+    block_texts    : typ.Sequence[str],
+    default_options: wrapper.Options,
+    page_manifest  : manifest.Manifest,
+    page           : str,
+) -> typ.List[str]:
+    # NOTE: Blocks which are in the html cache are read from it
+    #   directly, only the remaining blocks go to draw_bob and are
+    #   reported as rendered. The html cache key covers the backend,
+    #   so that the manifest is not used across versions of svgbob.
+    #   Blocks with tag_type img_file are never cached as html, so
+    #   they always go to draw_bob (which writes the image file
+    #   again, if it was removed).
+    options_key = _html_cache_key("", default_options)
+    entries     = [
+        (_manifest_block_key(block_text, options_key), _html_cache_key(block_text, default_options))
+        for block_text in block_texts
+    ]
+    img_tags = [_get_manifest_html(page_manifest, entry) for entry in entries]
+
+    missing_idxs = [idx for idx, img_tag in enumerate(img_tags) if img_tag is None]
+    missing_tags = draw_bob_many([block_texts[idx] for idx in missing_idxs], default_options)
+    for idx, img_tag in zip(missing_idxs, missing_tags):
+        img_tags[idx] = img_tag
+        if not HTML_CACHE_ENABLED:
+            # the manifest reads the html from the cache in later builds
+            _put_manifest_html(block_texts[idx], default_options, entries[idx][1], img_tag)
+
+    rendered = {entries[idx][0] for idx in missing_idxs}
+    page_manifest.update(page, entries, rendered)
+    return typ.cast(typ.List[str], img_tags)
+
+
+DEFAULT_CONFIG: typ.Dict[str, typ.List[typ.Any]] = {
+    'tag_type'      : [
+        "inline_svg",
+        "Format to use (inline_svg|img_utf8_svg|img_base64_svg|img_file)",
+    ],
     'bg_color'      : ["white"     , "Set the background color"],
     'fg_color'      : ["black"     , "Set the foreground color"],
     'min_char_width': [""          , "Minimum width of diagram in characters"],
+    'img_dir'       : [""          , "Directory to write svg files to (tag_type: img_file)"],
+    'img_url'       : [""          , "URL prefix of img_dir (tag_type: img_file)"],
+    'dedup_svg'     : [False       , "Emit identical inline_svg diagrams only once per page"],
+    'minify'        : [False       , "Minify svg output (coordinate precision, stylesheet)"],
+    'backend'       : [""          , "Renderer of the process (subprocess|module|module:<name>)"],
+    'manifest'      : [""          , "Path of a manifest file, to reuse unchanged diagrams"],
 }
 
+# Config keys which are used by the postprocessor rather than draw_bob
+POSTPROC_CONFIG_KEYS = {'dedup_svg'}
+
+# Config keys which apply to the process (see SvgbobExtension.extendMarkdown)
+GLOBAL_CONFIG_KEYS = {'backend', 'manifest'}
+
 
 class SvgbobExtension(Extension):
     def __init__(self, **kwargs) -> None:
-        self.config: typ.Dict[str, typ.List[str]] = copy.deepcopy(DEFAULT_CONFIG)
-        for name, options_text in wrapper.parse_options().items():
-            self.config[name] = ["", options_text]
-
+        # NOTE: The options of svgbob are only added to the config
+        #   when an unknown key is set, since discovering them may
+        #   involve running `svgbob --help`.
+        self.config: typ.Dict[str, typ.List[typ.Any]] = copy.deepcopy(DEFAULT_CONFIG)
         self.images: typ.Dict[str, str] = {}
+        self.page   = ""
+        # shared by all instances, see markdown_svgbob.metrics
+        self.metrics = metrics.METRICS
         super().__init__(**kwargs)
 
+    def set_page(self, page: str) -> None:
+        """Set the page (e.g. its path) that is converted next.
+
+        This is only used to organize the manifest, blocks are
+        reused from the manifest regardless of their page.
+        """
+        self.page = page
+
+    def get_manifest(self) -> typ.Optional[manifest.Manifest]:
+        manifest_path = self.getConfig('manifest', "")
+        if manifest_path:
+            return manifest.get_manifest(pl.Path(manifest_path).expanduser())
+        else:
+            return None
+
+    def _add_svgbob_options(self) -> None:
+        for name, options_text in wrapper.parse_options().items():
+            if name not in self.config:
+                self.config[name] = ["", options_text]
+
+    def setConfig(self, key: str, value: typ.Any) -> None:
+        if key not in self.config:
+            self._add_svgbob_options()
+        super().setConfig(key, value)
+
+    def getConfigInfo(self) -> typ.List[typ.Tuple[str, str]]:
+        self._add_svgbob_options()
+        return super().getConfigInfo()
+
     def reset(self) -> None:
         self.images.clear()
 
     def extendMarkdown(self, md) -> None:
+        # NOTE: The backend is process-global (see wrapper.set_backend),
+        #   so setting it affects all instances, not just this one.
+        backend = self.getConfig('backend', "")
+        if backend:
+            wrapper.set_backend(backend)
+
         preproc = SvgbobPreprocessor(md, self)
         md.preprocessors.register(preproc, name='svgbob_fenced_code_block', priority=50)
 
@@ -201,6 +628,7 @@ class SvgbobPreprocessor(Preprocessor):
     def __init__(self, md, ext: SvgbobExtension) -> None:
         super().__init__(md)
         self.ext: SvgbobExtension = ext
+        self._pending_blocks: typ.Dict[str, str] = {}
 
     @property
     def default_options(self) -> wrapper.Options:
@@ -209,6 +637,8 @@ class SvgbobPreprocessor(Preprocessor):
             'min_char_width': self.ext.getConfig('min_char_width', ""),
         }
         for name in self.ext.config.keys():
+            if name in POSTPROC_CONFIG_KEYS or name in GLOBAL_CONFIG_KEYS:
+                continue
             val = self.ext.getConfig(name, "")
             if val != "":
                 options[name] = val
@@ -216,42 +646,80 @@ class SvgbobPreprocessor(Preprocessor):
 
     def _make_tag_for_block(self, block_lines: typ.List[str]) -> str:
         block_text = "\n".join(block_lines).rstrip()
-        img_tag    = draw_bob(block_text, self.default_options)
-        img_id     = make_marker_id(img_tag)
-        marker_tag = f"<p id=\"tmp_md_svgbob{img_id}\">svgbob{img_id}</p>"
-        tag_text   = f"<p>{img_tag}</p>"
+        img_id     = make_marker_id(block_text)
+        marker_tag = _make_marker_tag(img_id)
 
-        self.ext.images[marker_tag] = tag_text
+        self._pending_blocks[marker_tag] = block_text
         return marker_tag
 
-    def _iter_out_lines(self, lines: typ.List[str]) -> typ.Iterable[str]:
-        is_in_fence          = False
-        expected_close_fence = "```"
+    def _render_pending_blocks(self) -> None:
+        # NOTE: The blocks are only rendered after all of them
+        #   have been collected, so that they can be rendered
+        #   concurrently rather than one svgbob process at a time.
+        marker_tags = [
+            marker_tag for marker_tag in self._pending_blocks if marker_tag not in self.ext.images
+        ]
+        block_texts = [self._pending_blocks[marker_tag] for marker_tag in marker_tags]
+
+        page_manifest = self.ext.get_manifest()
+        if page_manifest is None:
+            img_tags = draw_bob_many(block_texts, self.default_options)
+        else:
+            img_tags = _draw_bob_with_manifest(
+                block_texts, self.default_options, page_manifest, self.ext.page
+            )
+        for marker_tag, img_tag in zip(marker_tags, img_tags):
+            self.ext.images[marker_tag] = f"<p>{img_tag}</p>"
+
+        self._pending_blocks.clear()
 
-        block_lines: typ.List[str] = []
-
-        for line in lines:
-            if is_in_fence:
-                block_lines.append(line)
-                is_ending_fence = line.strip() == expected_close_fence
-                if not is_ending_fence:
-                    continue
-
-                is_in_fence = False
-                marker_tag  = self._make_tag_for_block(block_lines)
-                del block_lines[:]
-                yield marker_tag
+    def _iter_out_lines(self, lines: typ.List[str]) -> typ.Iterable[str]:
+        for chunk in iter_fence_chunks(lines):
+            if isinstance(chunk, str):
+                yield chunk
             else:
-                fence_match = BLOCK_START_RE.match(line)
-                if fence_match:
-                    is_in_fence          = True
-                    expected_close_fence = fence_match.group(1)
-                    block_lines.append(line)
-                else:
-                    yield line
+                yield self._make_tag_for_block(chunk)
 
     def run(self, lines: typ.List[str]) -> typ.List[str]:
-        return list(self._iter_out_lines(lines))
+        with metrics.METRICS.timed("preprocessor"):
+            out_lines = list(self._iter_out_lines(lines))
+            if self._pending_blocks:
+                self._render_pending_blocks()
+        return out_lines
+
+
+HTML_STYLE_RE = re.compile(r"<style[^>]*>.*?</style>", flags=re.DOTALL)
+
+
+def _remove_repeated_styles(svg_html: str, found_styles: typ.Set[str]) -> str:
+    # NOTE: A <style> in an inline svg applies to the whole html
+    #   document, so a stylesheet that is identical to that of a
+    #   previous diagram on the same page is redundant.
+    def _repl(match: typ.Match[str]) -> str:
+        style = match.group(0)
+        if style in found_styles:
+            return ""
+        else:
+            found_styles.add(style)
+            return style
+
+    return HTML_STYLE_RE.sub(_repl, svg_html)
+
+
+def _add_svg_id(svg_html: str, svg_id: str) -> str:
+    return svg_html.replace("<svg", f"<svg id=\"{svg_id}\"", 1)
+
+
+def _make_svg_ref(svg_html: str, svg_id: str) -> str:
+    # NOTE: Rather than repeating the whole svg, later occurrences
+    #   of the same diagram reference the first one (which was
+    #   given an id by _add_svg_id).
+    size_attrs = _get_size_attrs(svg_html)
+    return (
+        f'<svg class="bob" xmlns="http://www.w3.org/2000/svg"{size_attrs}>'
+        f'<use href="#{svg_id}"/>'
+        f"</svg>"
+    )
 
 
 # NOTE (mb):
@@ -270,15 +738,45 @@ class SvgbobPostprocessor(Postprocessor):
         self.ext: SvgbobExtension = ext
 
     def run(self, text: str) -> str:
-        for marker_tag, img in self.ext.images.items():
-            if marker_tag in text:
-                wrapped_marker = "<p>" + marker_tag + "</p>"
-                while marker_tag in text:
-                    if wrapped_marker in text:
-                        text = text.replace(wrapped_marker, img)
-                    else:
-                        text = text.replace(marker_tag, img)
-            elif 'class="toc"' not in text:
-                logger.warning(f"SvgbobPostprocessor couldn't find: {marker_tag}")
+        if not self.ext.images:
+            return text
+
+        with metrics.METRICS.timed("postprocessor"):
+            return self._run(text)
+
+    def _run(self, text: str) -> str:
+        images = self.ext.images
+
+        found_markers: typ.Set[str] = set()
+        found_styles : typ.Set[str] = set()
+
+        dedup_svg = bool(self.ext.getConfig('dedup_svg', False))
+        minify    = bool(self.ext.getConfig('minify'   , False))
+
+        def _repl(match: typ.Match[str]) -> str:
+            img_id     = match.group('id')
+            marker_tag = _make_marker_tag(img_id)
+            img        = images.get(marker_tag)
+            if img is None:
+                return match.group(0)
+
+            is_repeated = marker_tag in found_markers
+            found_markers.add(marker_tag)
+            if minify and img.startswith("<p><svg"):
+                img = _remove_repeated_styles(img, found_styles)
+            if dedup_svg and img.startswith("<p><svg"):
+                svg_id = "svgbob" + img_id
+                if is_repeated:
+                    return "<p>" + _make_svg_ref(img[3:], svg_id) + "</p>"
+                else:
+                    return "<p>" + _add_svg_id(img[3:], svg_id)
+            return img
+
+        text = MARKER_RE.sub(_repl, text)
+
+        if len(found_markers) < len(images) and 'class="toc"' not in text:
+            for marker_tag in images:
+                if marker_tag not in found_markers:
+                    logger.warning(f"SvgbobPostprocessor couldn't find: {marker_tag}")
 
         return text
@@ -0,0 +1,183 @@
+# This file is part of the markdown-svgbob project
+# https://github.com/mbarkhau/markdown-svgbob
+#
+# Copyright (c) 2019-2024 Manuel Barkhau (mbarkhau@gmail.com) - MIT License
+# SPDX-License-Identifier: MIT
+import json
+import typing as typ
+import logging
+import threading
+
+import pathlib2 as pl
+
+from markdown_svgbob import cache
+
+logger = logging.getLogger(__name__)
+
+
+MANIFEST_VERSION = 2
+
+# (block key, output ref)
+BlockEntry = typ.Tuple[str, str]
+
+
+class Manifest:
+    """Persistent record of the bob blocks of each page.
+
+    For every block, the manifest maps its key (derived from its
+    text and options) to a reference to its rendered output in
+    the cache. Blocks with a known key are reused without being
+    rendered again, regardless of the page they are on. The keys
+    of the blocks of each (known) page are recorded as well.
+    Which blocks were rendered and which were reused is recorded
+    for report(), until the end of the build (see save()).
+    """
+
+    def __init__(self, fpath: pl.Path) -> None:
+        self.fpath = fpath
+
+        self._lock  = threading.Lock()
+        self._dirty = False
+
+        self.pages : typ.Dict[str, typ.List[str]] = {}
+        self.blocks: typ.Dict[str, str] = {}
+
+        self.rendered: typ.Dict[str, typ.List[str]] = {}
+        self.reused  : typ.Dict[str, typ.List[str]] = {}
+
+        self.load()
+
+    def load(self) -> None:
+        try:
+            with self.fpath.open(mode="rb") as fobj:
+                data = json.loads(fobj.read().decode("utf-8"))
+        except (IOError, ValueError):
+            # missing or corrupt, start over
+            return
+
+        if data.get('version') != MANIFEST_VERSION:
+            return
+
+        with self._lock:
+            self.pages  = data['pages']
+            self.blocks = data['blocks']
+
+    def lookup(self, block_key: str) -> typ.Optional[str]:
+        return self.blocks.get(block_key)
+
+    def update(self, page: str, entries: typ.List[BlockEntry], rendered: typ.Set[str]) -> None:
+        """Add the blocks of a page.
+
+        If the page is known (not ""), its previous list of blocks
+        is replaced. The keys in rendered are reported as rendered,
+        all other entries as reused.
+        """
+        block_keys    = [block_key for block_key, _ in entries]
+        page_rendered = [block_key for block_key in block_keys if block_key in rendered]
+        page_reused   = [block_key for block_key in block_keys if block_key not in rendered]
+        with self._lock:
+            for block_key, ref in entries:
+                if self.blocks.get(block_key) != ref:
+                    self.blocks[block_key] = ref
+                    self._dirty            = True
+
+            if page and self.pages.get(page) != block_keys:
+                self.pages[page] = block_keys
+                self._dirty      = True
+
+            if page:
+                # only the latest conversion of a page is reported
+                self.rendered[page] = page_rendered
+                self.reused[page]   = page_reused
+            else:
+                self.rendered.setdefault(page, []).extend(page_rendered)
+                self.reused.setdefault(page, []).extend(page_reused)
+
+    def _prune_blocks(self) -> None:
+        # NOTE: Blocks of unknown pages ("") are only referenced
+        #   by the report, so blocks which were not used in this
+        #   build (and are not on any known page) are dropped.
+        referenced: typ.Set[str] = set()
+        for keys_by_page in (self.pages, self.rendered, self.reused):
+            for block_keys in keys_by_page.values():
+                referenced.update(block_keys)
+
+        for block_key in list(self.blocks):
+            if block_key not in referenced:
+                del self.blocks[block_key]
+                self._dirty = True
+
+    def save(self) -> None:
+        """Write the manifest and end the build.
+
+        Blocks which are not referenced anymore are dropped and
+        the report is logged and reset, so that it only covers
+        the conversions since the previous save.
+        """
+        with self._lock:
+            report = self._get_report()
+            if not (report['rendered'] or report['reused']):
+                # nothing was converted
+                return
+
+            self._prune_blocks()
+            if self._dirty:
+                data = {'version': MANIFEST_VERSION, 'pages': self.pages, 'blocks': self.blocks}
+                self.fpath.parent.mkdir(parents=True, exist_ok=True)
+                cache.write_atomic(self.fpath, json.dumps(data, sort_keys=True).encode("utf-8"))
+                self._dirty = False
+
+            self.rendered = {}
+            self.reused   = {}
+
+        logger.info(
+            f"svgbob manifest {self.fpath}: "
+            f"{report['rendered']} diagram(s) rendered, {report['reused']} reused"
+        )
+
+    def report(self) -> typ.Dict[str, typ.Any]:
+        """Blocks which were rendered and reused in the current build."""
+        with self._lock:
+            return self._get_report()
+
+    def _get_report(self) -> typ.Dict[str, typ.Any]:
+        pages = {
+            page: {
+                'rendered': list(self.rendered.get(page, [])),
+                'reused'  : list(self.reused.get(page, [])),
+            }
+            for page in sorted(set(self.rendered) | set(self.reused))
+        }
+        return {
+            'rendered': sum(len(page['rendered']) for page in pages.values()),
+            'reused'  : sum(len(page['reused'  ]) for page in pages.values()),
+            'pages'   : pages,
+        }
+
+
+# NOTE: Markdown instances (and their extensions) are often
+#   created per page (e.g. by mkdocs), so manifests are shared
+#   by path and saved when the process exits.
+
+_MANIFESTS_LOCK = threading.Lock()
+_MANIFESTS: typ.Dict[str, Manifest] = {}
+
+
+def get_manifest(fpath: pl.Path) -> Manifest:
+    key = str(fpath)
+    with _MANIFESTS_LOCK:
+        if key not in _MANIFESTS:
+            if not _MANIFESTS:
+                # pylint: disable=import-outside-toplevel ; lazy import to improve startup time
+                import atexit
+
+                atexit.register(save_all)
+            _MANIFESTS[key] = Manifest(fpath)
+        return _MANIFESTS[key]
+
+
+def save_all() -> None:
+    with _MANIFESTS_LOCK:
+        manifests = list(_MANIFESTS.values())
+    for manifest in manifests:
+        manifest.save()
@@ -0,0 +1,197 @@
+# This file is part of the markdown-svgbob project
+# https://github.com/mbarkhau/markdown-svgbob
+#
+# Copyright (c) 2019-2024 Manuel Barkhau (mbarkhau@gmail.com) - MIT License
+# SPDX-License-Identifier: MIT
+"""Optional metrics of the render pipeline.
+
+Metrics are disabled by default. They are enabled with enable()
+or by setting MDSVGBOB_METRICS to the path of a json file, to
+which the metrics are written when the process exits.
+"""
+import os
+import json
+import time
+import heapq
+import typing as typ
+import threading
+
+# Number of slowest renders that are kept
+MAX_SLOWEST = 10
+
+# (stage, duration, info)
+Hook = typ.Callable[[str, float, typ.Dict[str, typ.Any]], None]
+
+# (duration, label)
+SlowEntry = typ.Tuple[float, str]
+
+# NOTE: time.perf_counter is not available on python2
+clock: typ.Callable[[], float] = getattr(time, 'perf_counter', time.time)
+
+
+class StageStats:
+    def __init__(self) -> None:
+        self.count     = 0
+        self.total     = 0.0
+        self.max       = 0.0
+        self.bytes_in  = 0
+        self.bytes_out = 0
+
+    def to_dict(self) -> typ.Dict[str, typ.Any]:
+        return {
+            'count'    : self.count,
+            'total_ms' : round(self.total * 1000, 3),
+            'mean_ms'  : round(self.total * 1000 / self.count, 3) if self.count else 0.0,
+            'max_ms'   : round(self.max * 1000, 3),
+            'bytes_in' : self.bytes_in,
+            'bytes_out': self.bytes_out,
+        }
+
+
+class Metrics:
+    """Counts and durations per stage of the render pipeline.
+
+    Stages are recorded with record() (or the timed() context
+    manager), cache lookups with count(name + ".hit"/".miss").
+    Each hook is called with every recorded stage.
+    """
+
+    def __init__(self, max_slowest: int = MAX_SLOWEST) -> None:
+        self.enabled     = False
+        self.max_slowest = max_slowest
+        self.hooks: typ.List[Hook] = []
+
+        self._lock = threading.Lock()
+        self.stages  : typ.Dict[str, StageStats] = {}
+        self.counters: typ.Dict[str, int] = {}
+        self.slowest : typ.List[SlowEntry] = []
+
+    def record(
+        self,
+        stage    : str,
+        duration : float,
+        bytes_in : int = 0,
+        bytes_out: int = 0,
+        label    : typ.Optional[str] = None,
+    ) -> None:
+        with self._lock:
+            stats = self.stages.get(stage)
+            if stats is None:
+                stats = self.stages[stage] = StageStats()
+            stats.count     += 1
+            stats.total     += duration
+            stats.max        = max(stats.max, duration)
+            stats.bytes_in  += bytes_in
+            stats.bytes_out += bytes_out
+
+            if label is not None:
+                # min-heap, so the fastest of the slowest is replaced
+                entry = (duration, label)
+                if len(self.slowest) < self.max_slowest:
+                    heapq.heappush(self.slowest, entry)
+                else:
+                    heapq.heappushpop(self.slowest, entry)
+
+        if self.hooks:
+            info = {'bytes_in': bytes_in, 'bytes_out': bytes_out, 'label': label}
+            for hook in self.hooks:
+                hook(stage, duration, info)
+
+    def count(self, name: str, num: int = 1) -> None:
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + num
+
+    def count_lookup(self, cache_name: str, is_hit: bool) -> None:
+        if self.enabled:
+            self.count(cache_name + (".hit" if is_hit else ".miss"))
+
+    def timed(self, stage: str) -> "typ.ContextManager[None]":
+        if self.enabled:
+            return _StageTimer(self, stage)
+        else:
+            return _NULL_TIMER
+
+    def reset(self) -> None:
+        with self._lock:
+            self.stages.clear()
+            self.counters.clear()
+            del self.slowest[:]
+
+    def _hit_ratios(self) -> typ.Dict[str, float]:
+        ratios: typ.Dict[str, float] = {}
+        for name, hits in self.counters.items():
+            if name.endswith(".hit"):
+                cache_name = name[: -len(".hit")]
+                misses     = self.counters.get(cache_name + ".miss", 0)
+                ratios[cache_name] = round(hits / (hits + misses), 4)
+        return ratios
+
+    def to_dict(self) -> typ.Dict[str, typ.Any]:
+        with self._lock:
+            stages = {name: stats.to_dict() for name, stats in sorted(self.stages.items())}
+            return {
+                'stages'    : stages,
+                'counters'  : dict(sorted(self.counters.items())),
+                'hit_ratios': dict(sorted(self._hit_ratios().items())),
+                'slowest'   : [
+                    {'label': label, 'duration_ms': round(duration * 1000, 3)}
+                    for duration, label in sorted(self.slowest, reverse=True)
+                ],
+            }
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_dict(), indent=2)
+
+
+class _StageTimer:
+    def __init__(self, metrics: Metrics, stage: str) -> None:
+        self.metrics = metrics
+        self.stage   = stage
+        self.t0      = 0.0
+
+    def __enter__(self) -> None:
+        self.t0 = clock()
+
+    def __exit__(self, *exc_info: typ.Any) -> None:
+        self.metrics.record(self.stage, clock() - self.t0)
+
+
+class _NullTimer:
+    def __enter__(self) -> None:
+        pass
+
+    def __exit__(self, *exc_info: typ.Any) -> None:
+        pass
+
+
+_NULL_TIMER = _NullTimer()
+
+
+METRICS = Metrics()
+
+
+def enable() -> Metrics:
+    METRICS.enabled = True
+    return METRICS
+
+
+def disable() -> None:
+    METRICS.enabled = False
+
+
+def write_json(fpath: str) -> None:
+    with open(fpath, mode="wb") as fobj:
+        fobj.write(METRICS.to_json().encode("utf-8"))
+
+
+def _init_from_env() -> None:
+    metrics_path = os.environ.get('MDSVGBOB_METRICS')
+    if metrics_path:
+        # pylint: disable=import-outside-toplevel ; lazy import to improve startup time
+        import atexit
+
+        enable()
+        atexit.register(write_json, metrics_path)
+
+
+_init_from_env()
@@ -0,0 +1,296 @@
+# This file is part of the markdown-svgbob project
+# https://github.com/mbarkhau/markdown-svgbob
+#
+# Copyright (c) 2019-2024 Manuel Barkhau (mbarkhau@gmail.com) - MIT License
+# SPDX-License-Identifier: MIT
+"""Run svgbob processes, subject to limits.
+
+The limits on input size and run time apply to every backend,
+the memory and cpu limits only to svgbob processes on posix
+systems.
+"""
+import os
+import errno
+import signal
+import typing as typ
+import logging
+import threading
+
+if typ.TYPE_CHECKING:
+    # NOTE: subprocess is only imported when it is used,
+    #   to reduce import time.
+    import subprocess as sp
+
+logger = logging.getLogger(__name__)
+
+
+SIG_NAME_BY_NUM = {
+    k: v
+    for v, k in sorted(signal.__dict__.items(), reverse=True)
+    if v.startswith('SIG') and not v.startswith('SIG_')
+}
+
+assert SIG_NAME_BY_NUM[15] == 'SIGTERM'
+
+
+class SvgbobException(Exception):
+    pass
+
+
+class SvgbobSignalException(SvgbobException):
+    """Raised when the svgbob process was terminated by a signal."""
+
+
+class SvgbobLimitException(SvgbobException):
+    """Raised when a render exceeds one of the configured limits."""
+
+
+class SvgbobTimeoutException(SvgbobLimitException):
+    """Raised when the svgbob process didn't finish before the timeout."""
+
+
+# NOTE: Limits are applied to each svgbob process, so that a
+#   pathological diagram can't hang or exhaust a build worker.
+#   The memory and cpu limits are set via rlimits and are only
+#   supported on posix systems. A limit of None is not enforced.
+
+LIMIT_NAMES = ('timeout', 'max_input_bytes', 'max_memory_bytes', 'max_cpu_seconds')
+
+# Limits enforced when MDSVGBOB_<NAME> is not set
+DEFAULT_LIMITS: typ.Dict[str, typ.Optional[float]] = {'timeout': 60}
+
+Limits = typ.Dict[str, typ.Optional[float]]
+
+
+def _default_limits() -> Limits:
+    limits: Limits = {}
+    for name in LIMIT_NAMES:
+        env_val = os.environ.get('MDSVGBOB_' + name.upper())
+        if env_val is None:
+            limits[name] = DEFAULT_LIMITS.get(name)
+        elif env_val in ("", "0"):
+            limits[name] = None
+        else:
+            try:
+                limits[name] = float(env_val)
+            except ValueError:
+                logger.warning(f"Invalid value for MDSVGBOB_{name.upper()}: {env_val!r}")
+                limits[name] = DEFAULT_LIMITS.get(name)
+    return limits
+
+
+_LIMITS: Limits = _default_limits()
+
+
+def get_limits() -> Limits:
+    return dict(_LIMITS)
+
+
+def set_limits(**limits: typ.Optional[float]) -> None:
+    """Set limits for svgbob processes (see LIMIT_NAMES).
+
+    Limits which are not passed are left unchanged, a limit
+    of None disables it.
+    """
+    for name, value in limits.items():
+        if name not in LIMIT_NAMES:
+            raise KeyError(f"Invalid limit '{name}', must be one of {', '.join(LIMIT_NAMES)}")
+        if value is not None and value <= 0:
+            raise ValueError(f"Invalid value for limit '{name}': {value}")
+    _LIMITS.update(limits)
+
+
+def check_input_size(input_data: bytes) -> None:
+    max_input_bytes = _LIMITS['max_input_bytes']
+    if max_input_bytes is not None and len(input_data) > max_input_bytes:
+        raise SvgbobLimitException(
+            f"Error processing svgbob image: input of {len(input_data)} bytes"
+            f" exceeds max_input_bytes={int(max_input_bytes)}"
+        )
+
+
+# (resource, soft limit, hard limit)
+RLimit = typ.Tuple[int, int, int]
+
+
+def get_rlimits() -> typ.List[RLimit]:
+    max_memory_bytes = _LIMITS['max_memory_bytes']
+    max_cpu_seconds  = _LIMITS['max_cpu_seconds']
+    if os.name != 'posix' or (max_memory_bytes is None and max_cpu_seconds is None):
+        return []
+
+    # pylint: disable=import-outside-toplevel ; not available on windows
+    import math
+    import resource
+
+    rlimits: typ.List[RLimit] = []
+    if max_memory_bytes is not None:
+        rlimits.append((resource.RLIMIT_AS, int(max_memory_bytes), int(max_memory_bytes)))
+    if max_cpu_seconds is not None:
+        # SIGXCPU at the soft limit, SIGKILL at the hard limit
+        cpu_seconds = math.ceil(max_cpu_seconds)
+        rlimits.append((resource.RLIMIT_CPU, cpu_seconds, cpu_seconds + 1))
+    return rlimits
+
+
+def _set_rlimits(rlimits: typ.List[RLimit]) -> None:
+    # pylint: disable=import-outside-toplevel ; not available on windows
+    import resource
+
+    for rlimit_resource, soft, hard in rlimits:
+        resource.setrlimit(rlimit_resource, (soft, hard))
+
+
+def _has_prlimit() -> bool:
+    try:
+        # pylint: disable=import-outside-toplevel ; not available on windows
+        import resource
+    except ImportError:
+        return False
+    return hasattr(resource, 'prlimit')
+
+
+def get_preexec_fn(rlimits: typ.List[RLimit]) -> typ.Optional[typ.Callable[[], None]]:
+    # NOTE: preexec_fn is not safe to use with threads, so it's only
+    #   used where resource.prlimit is not available (it is on linux).
+    if rlimits and not _has_prlimit():
+        return lambda: _set_rlimits(rlimits)
+    else:
+        return None
+
+
+def apply_rlimits(pid: int, rlimits: typ.List[RLimit]) -> None:
+    # NOTE: svgbob doesn't do any work before its input is written,
+    #   so applying the limits after the process was started but
+    #   before the input is written doesn't leave a gap (at most
+    #   the limits already apply while the binary is loaded).
+    if not (rlimits and _has_prlimit()):
+        return
+
+    # pylint: disable=import-outside-toplevel ; not available on windows
+    import resource
+
+    for rlimit_resource, soft, hard in rlimits:
+        try:
+            resource.prlimit(pid, rlimit_resource, (soft, hard))
+        except OSError as ex:
+            # NOTE: ProcessLookupError is not available on python2
+            if ex.errno == errno.ESRCH:
+                # already ended, the return code is checked later
+                return
+            raise
+
+
+# Signals with which the process may end if it exceeds an rlimit
+RLIMIT_SIGNALS = {'SIGXCPU', 'SIGKILL', 'SIGABRT', 'SIGSEGV'}
+
+
+def timeout_error(timeout: typ.Optional[float]) -> SvgbobTimeoutException:
+    return SvgbobTimeoutException(
+        f"Error processing svgbob image: svgbob_cli process timed out after {timeout}s"
+    )
+
+
+def signal_error(
+    ret_code: int, rlimits: typ.Optional[typ.List[RLimit]] = None
+) -> SvgbobException:
+    signame = SIG_NAME_BY_NUM[abs(ret_code)]
+    err_msg = (
+        "Error processing svgbob image: "
+        + "svgbob_cli process ended with "
+        + f"code {ret_code} ({signame})"
+    )
+    if rlimits and signame in RLIMIT_SIGNALS:
+        err_msg += ", probably because it exceeded max_memory_bytes or max_cpu_seconds"
+        return SvgbobLimitException(err_msg)
+    else:
+        return SvgbobSignalException(err_msg)
+
+
+def output_error(stdout: str, errout: str) -> SvgbobException:
+    output = (stdout + "\n" + errout).strip()
+    return SvgbobException(f"Error processing svgbob image: {output}")
+
+
+def _communicate_with_timer(
+    proc: "sp.Popen[bytes]", input_data: bytes, timeout: typ.Optional[float]
+) -> typ.Tuple[bytes, bytes]:
+    # NOTE: On python2, communicate has no timeout, instead the
+    #   process is killed by a timer thread.
+    killed: typ.List[bool] = []
+
+    def _kill() -> None:
+        killed.append(True)
+        try:
+            proc.kill()
+        except OSError:
+            # already ended
+            pass
+
+    timer = threading.Timer(timeout, _kill) if timeout else None
+    if timer:
+        timer.start()
+    try:
+        stdout, stderr = proc.communicate(input_data)
+    finally:
+        if timer:
+            timer.cancel()
+
+    if killed and proc.returncode < 0:
+        raise timeout_error(timeout)
+    return stdout, stderr
+
+
+def _communicate(
+    proc: "sp.Popen[bytes]", input_data: bytes, timeout: typ.Optional[float]
+) -> typ.Tuple[bytes, bytes]:
+    # pylint: disable=import-outside-toplevel ; lazy import to improve startup time
+    import subprocess as sp
+
+    if not hasattr(sp, 'TimeoutExpired'):
+        return _communicate_with_timer(proc, input_data, timeout)
+
+    try:
+        return proc.communicate(input_data, timeout=timeout)
+    except sp.TimeoutExpired:
+        proc.kill()
+        proc.communicate()
+        raise timeout_error(timeout)
+
+
+def run_svgbob(cmd_parts: typ.List[str], input_data: bytes) -> bytes:
+    # pylint: disable=consider-using-with ; not supported on py27
+    # pylint: disable=import-outside-toplevel ; lazy import to improve startup time
+    import subprocess as sp
+
+    check_input_size(input_data)
+    rlimits = get_rlimits()
+    timeout = _LIMITS['timeout']
+
+    # NOTE: communicate writes the input and reads stdout/stderr
+    #   concurrently, so neither process can block on a full pipe.
+    proc = sp.Popen(
+        cmd_parts,
+        stdin=sp.PIPE,
+        stdout=sp.PIPE,
+        stderr=sp.PIPE,
+        preexec_fn=get_preexec_fn(rlimits),
+    )
+    apply_rlimits(proc.pid, rlimits)
+
+    try:
+        stdout, stderr = _communicate(proc, input_data, timeout)
+    except SvgbobTimeoutException:
+        raise
+    except BaseException:
+        proc.kill()
+        proc.communicate()
+        raise
+
+    ret_code = proc.returncode
+    if ret_code < 0:
+        raise signal_error(ret_code, rlimits)
+    elif ret_code > 0:
+        raise output_error(stdout.decode("utf-8"), stderr.decode("utf-8"))
+
+    return stdout
@@ -10,27 +10,71 @@
 
 import os
 import re
-import time
-import signal
+import json
 import typing as typ
 import hashlib
+import logging
 import platform
 import tempfile
-import subprocess as sp
+import threading
 
 import pathlib2 as pl
 
-SIG_NAME_BY_NUM = {
-    k: v
-    for v, k in sorted(signal.__dict__.items(), reverse=True)
-    if v.startswith('SIG') and not v.startswith('SIG_')
-}
+from markdown_svgbob import cache
+from markdown_svgbob import metrics
+from markdown_svgbob import process
 
-assert SIG_NAME_BY_NUM[15] == 'SIGTERM'
+if typ.TYPE_CHECKING:
+    # NOTE: concurrent.futures is only imported when it is
+    #   used, to reduce import time.
+    from concurrent.futures import Future
+    from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+SIG_NAME_BY_NUM = process.SIG_NAME_BY_NUM
+
+SvgbobException        = process.SvgbobException
+SvgbobSignalException  = process.SvgbobSignalException
+SvgbobLimitException   = process.SvgbobLimitException
+SvgbobTimeoutException = process.SvgbobTimeoutException
+
+LIMIT_NAMES = process.LIMIT_NAMES
+get_limits  = process.get_limits
+set_limits  = process.set_limits
 
 
 TMP_DIR = pl.Path(tempfile.gettempdir()) / "mdsvgbob"
 
+
+def _default_cache_dir() -> pl.Path:
+    env_cache_dir = os.environ.get('MDSVGBOB_CACHE_DIR')
+    if env_cache_dir:
+        return pl.Path(env_cache_dir).expanduser()
+    else:
+        return TMP_DIR
+
+
+DISK_CACHE = cache.DiskCache(
+    _default_cache_dir(), compress=os.environ.get('MDSVGBOB_CACHE_COMPRESS') == "1"
+)
+
+# In memory cache in front of DISK_CACHE, so that repeated
+# renders of the same image don't cause any filesystem access.
+SVG_CACHE = cache.MemoryCache()
+
+
+def set_cache_dir(cache_dir: pl.Path, compress: bool = False) -> None:
+    """Use a different directory for the on-disk cache.
+
+    This can be used to share a (warm) cache between builds, for
+    example a per-project directory or an XDG cache directory.
+    """
+    global DISK_CACHE   # pylint:disable=global-statement ; replaced as a whole
+    DISK_CACHE = cache.DiskCache(pl.Path(cache_dir), compress=compress)
+
+
 LIBDIR: pl.Path = pl.Path(__file__).parent
 PKG_BIN_DIR      = LIBDIR / "bin"
 FALLBACK_BIN_DIR = pl.Path("~") / ".cargo" / "bin"
@@ -87,7 +131,11 @@ def _get_pkg_bin_path(osname: str = OSNAME, machine: str = MACHINE) -> pl.Path:
     raise NotImplementedError(err_msg)
 
 
-def get_bin_cmd() -> typ.List[str]:
+def _find_bin_cmd() -> typ.List[str]:
+    env_bin_path = os.environ.get('MDSVGBOB_BIN')
+    if env_bin_path:
+        return [env_bin_path]
+
     usr_bin_cmd = _get_usr_bin_path()
     if usr_bin_cmd is None:
         # use packaged binary
@@ -96,6 +144,29 @@ def get_bin_cmd() -> typ.List[str]:
         return [str(usr_bin_cmd)]
 
 
+# NOTE: The first lookups of the binary, its id and the backend
+#   may happen concurrently in several pool workers, so they are
+#   done while holding this lock and stored in one step.
+_LOOKUP_LOCK = threading.RLock()
+
+_BIN_CMD: typ.List[str] = []
+
+
+def get_bin_cmd() -> typ.List[str]:
+    """Find the svgbob command.
+
+    The lookup is only done once per process, use reset_bin_cache
+    if the svgbob binary was installed or removed in the meantime.
+    The environment variable MDSVGBOB_BIN can be used to pin the
+    binary that is used.
+    """
+    with _LOOKUP_LOCK:
+        if not _BIN_CMD:
+            with metrics.METRICS.timed("bin_lookup"):
+                _BIN_CMD[:] = _find_bin_cmd()
+        return list(_BIN_CMD)
+
+
 def get_bin_path() -> pl.Path:
     return pl.Path(get_bin_cmd()[0])
 
@@ -118,14 +189,10 @@ ArgValue = typ.Union[str, int, float, bool]
 Options  = typ.Dict[str, ArgValue]
 
 
-class SvgbobException(Exception):
-    pass
+OptionArg = typ.Tuple[str, typ.Optional[str]]
 
 
-def _iter_cmd_parts(options: Options = None) -> typ.Iterable[str]:
-    for cmd_part in get_bin_cmd():
-        yield cmd_part
-
+def _iter_option_args(options: Options = None) -> typ.Iterable[OptionArg]:
     if options:
         for option_name, option_value in options.items():
             if option_name.startswith("--"):
@@ -134,85 +201,270 @@ def _iter_cmd_parts(options: Options = None) -> typ.Iterable[str]:
                 arg_name = "--" + option_name
 
             if option_value is True:
-                yield arg_name
+                yield (arg_name, None)
             elif option_value is False:
                 continue
             else:
-                arg_value = str(option_value)
-                yield arg_name
-                yield arg_value
+                yield (arg_name, str(option_value))
 
 
-def text2svg(image_text: str, options: Options = None) -> bytes:
-    # pylint: disable=consider-using-with ; not supported on py27
-    cmd_parts = list(_iter_cmd_parts(options))
+def _iter_cmd_parts(options: Options = None) -> typ.Iterable[str]:
+    for cmd_part in get_bin_cmd():
+        yield cmd_part
+
+    for arg_name, arg_value in _iter_option_args(options):
+        yield arg_name
+        if arg_value is not None:
+            yield arg_value
+
+
+def _get_bin_id(bin_path: str) -> str:
+    """Identify a svgbob binary by the hash of its content.
+
+    Rather than the path of the binary, this is used for the
+    cache key, so that caches can be shared between machines
+    and are invalidated when svgbob is upgraded.
+    """
+    hasher = hashlib.sha256()
+    with metrics.METRICS.timed("bin_hash"), open(bin_path, mode="rb") as fobj:
+        for chunk in iter(lambda: fobj.read(64 * 1024), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
 
-    input_data = image_text.encode("utf-8")
 
+_BIN_ID: typ.List[str] = []
+
+
+def get_bin_id() -> str:
+    # NOTE: The id is part of every cache key, so it is only
+    #   computed once per process (like get_bin_cmd), rather
+    #   than checking the binary for changes on every lookup.
+    with _LOOKUP_LOCK:
+        if not _BIN_ID:
+            _BIN_ID[:] = [_get_bin_id(get_bin_cmd()[0])]
+        return _BIN_ID[0]
+
+
+def _make_digest(input_data: bytes, backend_id: str, options: Options = None) -> str:
     hasher = hashlib.sha256(input_data)
-    for cmd_part in cmd_parts:
-        hasher.update(cmd_part.encode("utf-8"))
+    hasher.update(b"\x00")
+    hasher.update(backend_id.encode("utf-8"))
+    for arg_name, arg_value in sorted(_iter_option_args(options), key=lambda arg: arg[0]):
+        hasher.update(b"\x00" + arg_name.encode("utf-8"))
+        if arg_value is not None:
+            hasher.update(b"=" + arg_value.encode("utf-8"))
+
+    return hasher.hexdigest()
+
+
+class Backend:
+    """Renders svgbob images.
+
+    The id of a backend is part of the cache key, so it should
+    change whenever the output of the backend may change.
+    """
+
+    name = ""
+
+    def get_id(self) -> str:
+        raise NotImplementedError
+
+    def render(self, input_data: bytes, options: Options = None) -> bytes:
+        raise NotImplementedError
+
+
+class SubprocessBackend(Backend):
+    """Renders with the svgbob binary (see get_bin_cmd)."""
+
+    name = "subprocess"
+
+    def get_id(self) -> str:
+        return get_bin_id()
+
+    def render(self, input_data: bytes, options: Options = None) -> bytes:
+        cmd_parts = list(_iter_cmd_parts(options))
+        return process.run_svgbob(cmd_parts, input_data)
+
+
+class ModuleBackend(Backend):
+    """Renders in-process with an (optional) svgbob extension module.
+
+    The module must provide `to_svg(text: str, **settings) -> str`,
+    the svgbob options are passed as settings, with "-" replaced
+    by "_". Since no process is started, the timeout and rlimits
+    don't apply, only max_input_bytes.
+    """
 
-    digest = hasher.hexdigest()
+    name = "module"
 
-    tmp_output_file = TMP_DIR / (digest + ".svg")
+    def __init__(self, module_name: str = "svgbob") -> None:
+        self.module_name = module_name
+        self._module: typ.Any = None
 
-    if tmp_output_file.exists():
-        tmp_output_file.touch()
+    def _get_module(self) -> typ.Any:
+        if self._module is None:
+            # pylint: disable=import-outside-toplevel ; optional dependency
+            import importlib
+
+            try:
+                self._module = importlib.import_module(self.module_name)
+            except ImportError as ex:
+                raise SvgbobException(f"Backend module '{self.module_name}' not available: {ex}")
+        return self._module
+
+    def get_id(self) -> str:
+        version = getattr(self._get_module(), '__version__', "")
+        return f"module:{self.module_name}:{version}"
+
+    def render(self, input_data: bytes, options: Options = None) -> bytes:
+        process.check_input_size(input_data)
+        settings: typ.Dict[str, typ.Union[str, bool]] = {}
+        for arg_name, arg_value in _iter_option_args(options):
+            setting_name = arg_name[2:].replace("-", "_")
+            settings[setting_name] = True if arg_value is None else arg_value
+
+        svg_text = self._get_module().to_svg(input_data.decode("utf-8"), **settings)
+        return typ.cast(str, svg_text).encode("utf-8")
+
+
+def _make_backend(name: str) -> Backend:
+    if name in ("", SubprocessBackend.name):
+        return SubprocessBackend()
+    elif name == ModuleBackend.name:
+        return ModuleBackend()
+    elif name.startswith(ModuleBackend.name + ":"):
+        return ModuleBackend(name.split(":", 1)[1])
     else:
-        cmd_parts.extend(["--output", str(tmp_output_file)])
+        raise ValueError(f"Invalid backend '{name}', must be subprocess, module or module:<name>")
 
-        TMP_DIR.mkdir(parents=True, exist_ok=True)
 
-        proc = None
-        try:
-            proc  = sp.Popen(cmd_parts, stdin=sp.PIPE, stdout=sp.PIPE)
-            stdin = proc.stdin
-            assert stdin is not None
-
-            stdin.write(input_data)
-            stdin.close()
-            ret_code = proc.wait()
-
-            if ret_code < 0:
-                signame = SIG_NAME_BY_NUM[abs(ret_code)]
-                err_msg = (
-                    "Error processing svgbob image: "
-                    + "svgbob_cli process ended with "
-                    + f"code {ret_code} ({signame})"
-                )
-                raise SvgbobException(err_msg)
-            elif ret_code > 0:
-                stdout  = read_output(proc.stdout)
-                errout  = read_output(proc.stderr)
-                output  = (stdout + "\n" + errout).strip()
-                err_msg = f"Error processing svgbob image: {output}"
-                raise SvgbobException(err_msg)
-        finally:
-            if proc is not None:
-                # It might be reasonable that Popen itself raises an
-                # exception. In such a case, proc would still be None
-                # and there is nothing to close.
-                if proc.stdout is not None:
-                    proc.stdout.close()
-                if proc.stderr is not None:
-                    proc.stderr.close()
-
-    with tmp_output_file.open(mode="rb") as fobj:
-        result = fobj.read()
+_BACKEND: typ.List[Backend] = []
+
+
+def get_backend() -> Backend:
+    """The backend used for rendering.
+
+    By default this is the subprocess backend, unless the
+    environment variable MDSVGBOB_BACKEND is set.
+    """
+    with _LOOKUP_LOCK:
+        if not _BACKEND:
+            _BACKEND[:] = [_make_backend(os.environ.get('MDSVGBOB_BACKEND', ""))]
+        return _BACKEND[0]
+
+
+def set_backend(backend: typ.Union[str, Backend]) -> None:
+    if isinstance(backend, str):
+        backend = _make_backend(backend)
+    # NOTE: The id of the svgbob binary doesn't depend on the
+    #   backend, so it isn't recomputed (see reset_bin_cache).
+    with _LOOKUP_LOCK:
+        # fail early if the backend is not available
+        backend.get_id()
+        _BACKEND[:] = [backend]
+
+
+def _render_label(input_data: bytes) -> str:
+    # identifies a diagram in metrics.METRICS.slowest
+    for line in input_data.decode("utf-8").splitlines():
+        if line.strip():
+            return line.strip()[:40]
+    return ""
+
+
+def record_render(input_data: bytes, result: bytes, duration: float) -> None:
+    if metrics.METRICS.enabled:
+        label = _render_label(input_data)
+        metrics.METRICS.record("render", duration, len(input_data), len(result), label)
+
+
+def _render_svg(
+    input_data: bytes, backend: Backend, options: typ.Optional[Options], digest: str
+) -> bytes:
+    t0     = metrics.clock()
+    result = backend.render(input_data, options)
+    record_render(input_data, result, metrics.clock() - t0)
+    put_disk_cache_async(digest, result)
+    return result
 
-    _cleanup_tmp_dir()
 
-    return typ.cast(bytes, result)
+# NOTE: Rendered images are written to DISK_CACHE by a background
+#   thread, so that rendering doesn't wait for disk io. Until the
+#   write is done, the image is available from SVG_CACHE.
+
+_WRITER_LOCK = threading.Lock()
+_WRITER: typ.List["ThreadPoolExecutor"] = []
+_PENDING_WRITES: typ.Set["Future[None]"] = set()
+
+
+def _get_writer() -> "ThreadPoolExecutor":
+    if not _WRITER:
+        # pylint: disable=import-outside-toplevel ; lazy import to improve startup time
+        import atexit
+        from concurrent.futures import ThreadPoolExecutor
+
+        _WRITER.append(ThreadPoolExecutor(max_workers=1))
+        atexit.register(flush_disk_cache)
+    return _WRITER[0]
+
+
+def put_disk_cache_async(digest: str, data: bytes) -> None:
+    with _WRITER_LOCK:
+        future = _get_writer().submit(DISK_CACHE.put, digest, data)
+        _PENDING_WRITES.add(future)
+    future.add_done_callback(_on_write_done)
+
+
+def _on_write_done(future: "Future[None]") -> None:
+    with _WRITER_LOCK:
+        _PENDING_WRITES.discard(future)
+
+    exc = future.exception()
+    if exc is not None:
+        # a failed write only means a cache miss later on
+        logger.warning(f"Error writing to cache: {exc}")
+
+
+def flush_disk_cache() -> None:
+    """Wait until pending writes to DISK_CACHE are done."""
+    with _WRITER_LOCK:
+        pending = list(_PENDING_WRITES)
+    if pending:
+        # pylint: disable=import-outside-toplevel ; lazy import to improve startup time
+        from concurrent.futures import wait
+
+        # NOTE: Errors are not raised here, they were already
+        #   logged by _on_write_done.
+        wait(pending)
+
+
+def _get_cached_svg(digest: str) -> typ.Optional[bytes]:
+    result = SVG_CACHE.get(digest)
+    metrics.METRICS.count_lookup("svg_cache.memory", result is not None)
+    if result is None:
+        result = DISK_CACHE.get(digest)
+        metrics.METRICS.count_lookup("svg_cache.disk", result is not None)
+        if result is not None:
+            SVG_CACHE.put(digest, result)
+    return result
+
+
+def text2svg(image_text: str, options: Options = None) -> bytes:
+    backend    = get_backend()
+    input_data = image_text.encode("utf-8")
+    digest     = _make_digest(input_data, backend.get_id(), options)
+
+    result = _get_cached_svg(digest)
+    if result is None:
+        result = _render_svg(input_data, backend, options, digest)
+        SVG_CACHE.put(digest, result)
+        _cleanup_tmp_dir()
+
+    return result
 
 
 def _cleanup_tmp_dir() -> None:
-    min_mtime = time.time() - 24 * 60 * 60
-    for fpath in TMP_DIR.iterdir():
-        if fpath.is_file():
-            mtime = fpath.stat().st_mtime
-            if mtime < min_mtime:
-                fpath.unlink()
+    DISK_CACHE.evictor.maybe_evict()
 
 
 # NOTE: in order to not have to update the code
@@ -247,6 +499,9 @@ DEFAULT_HELP_TEXT = DEFAULT_HELP_TEXT.replace("\n", " ").replace("NL", "\n")
 
 def _get_cmd_help_text() -> str:
     # pylint: disable=consider-using-with ; not supported on py27
+    # pylint: disable=import-outside-toplevel ; lazy import to improve startup time
+    import subprocess as sp
+
     bin_parts = get_bin_cmd()
     cmd_parts = bin_parts + ['--help']
     proc      = None
@@ -299,13 +554,245 @@ def parse_options() -> OptionsHelp:
         return _PARSED_OPTIONS
 
     options = _parse_options_help_text(DEFAULT_HELP_TEXT)
-    try:
-        help_text   = _get_cmd_help_text()
-        cmd_options = _parse_options_help_text(help_text)
-        options.update(cmd_options)
-    except NotImplementedError:
-        # NOTE: no need to fail just for the options
-        pass
+    if isinstance(get_backend(), SubprocessBackend):
+        try:
+            options.update(_get_cmd_options())
+        except NotImplementedError:
+            # NOTE: no need to fail just for the options
+            pass
 
     _PARSED_OPTIONS.update(options)
     return options
+
+
+def _get_options_cache_key(bin_path: str) -> typ.Optional[str]:
+    try:
+        stat = os.stat(bin_path)
+    except OSError:
+        return None
+
+    bin_key = f"{bin_path}:{stat.st_mtime}:{stat.st_size}"
+    return hashlib.sha256(bin_key.encode("utf-8")).hexdigest()
+
+
+def _get_cmd_options() -> OptionsHelp:
+    # NOTE: The parsed options are persisted in the cache
+    #   directory, so that new processes don't have to run
+    #   `svgbob --help` as long as the binary is unchanged.
+    options_key = _get_options_cache_key(get_bin_cmd()[0])
+    if options_key:
+        cached_data = DISK_CACHE.get(options_key, suffix=".json")
+        if cached_data:
+            try:
+                return typ.cast(OptionsHelp, json.loads(cached_data.decode("utf-8")))
+            except ValueError:
+                pass
+
+    help_text   = _get_cmd_help_text()
+    cmd_options = _parse_options_help_text(help_text)
+    if options_key and cmd_options:
+        DISK_CACHE.put(options_key, json.dumps(cmd_options).encode("utf-8"), suffix=".json")
+    return cmd_options
+
+
+def reset_bin_cache() -> None:
+    """Forget the svgbob binary and options found previously."""
+    with _LOOKUP_LOCK:
+        del _BIN_CMD[:]
+        del _BIN_ID[:]
+    _PARSED_OPTIONS.clear()
+
+
+# NOTE: svgbob_cli reads its input until EOF and then exits,
+#   so a process can't be reused for multiple diagrams. What
+#   we can do is to keep a bounded set of long lived worker
+#   threads, which limits the number of concurrent svgbob
+#   processes and avoids thread setup for every diagram.
+
+
+def _default_pool_size() -> int:
+    env_size = os.environ.get('MDSVGBOB_POOL_SIZE', "")
+    if env_size.isdigit() and int(env_size) > 0:
+        return int(env_size)
+    else:
+        # pylint: disable=import-outside-toplevel ; lazy import to improve startup time
+        import multiprocessing
+
+        # NOTE: os.cpu_count is not available on python2
+        try:
+            return multiprocessing.cpu_count()
+        except NotImplementedError:
+            return 1
+
+
+# Number of retries if a svgbob process crashed (was killed by a signal)
+MAX_CRASH_RETRIES = 1
+
+_POOL_LOCK = threading.Lock()
+
+# NOTE: The default size is only determined when the pool is
+#   first used, since multiprocessing is slow to import.
+_POOL_SIZE: typ.List[int] = []
+_POOL     : typ.List["ThreadPoolExecutor"] = []
+
+
+def _get_pool_size() -> int:
+    # _POOL_LOCK must be held
+    if not _POOL_SIZE:
+        _POOL_SIZE.append(_default_pool_size())
+    return _POOL_SIZE[0]
+
+
+def get_pool_size() -> int:
+    with _POOL_LOCK:
+        return _get_pool_size()
+
+
+def set_pool_size(size: int) -> None:
+    """Set the maximum number of concurrent svgbob processes.
+
+    Pending renders of a previous pool are completed, but new
+    renders will be submitted to a new pool of the given size.
+    """
+    if size < 1:
+        raise ValueError(f"Invalid pool size: {size}")
+
+    with _POOL_LOCK:
+        _POOL_SIZE[:] = [size]
+        while _POOL:
+            _POOL.pop().shutdown(wait=False)
+
+
+def get_pool() -> "ThreadPoolExecutor":
+    # pylint: disable=import-outside-toplevel ; lazy import to improve startup time
+    from concurrent.futures import ThreadPoolExecutor
+
+    with _POOL_LOCK:
+        if not _POOL:
+            pool = ThreadPoolExecutor(max_workers=_get_pool_size())
+            _POOL.append(pool)
+        return _POOL[0]
+
+
+def shutdown_pool(wait: bool = True) -> None:
+    with _POOL_LOCK:
+        while _POOL:
+            _POOL.pop().shutdown(wait=wait)
+
+
+RT = typ.TypeVar('RT')
+
+
+def _call_with_retry(func: typ.Callable[..., RT], *args: typ.Any) -> RT:
+    retries = MAX_CRASH_RETRIES
+    while True:
+        try:
+            return func(*args)
+        except SvgbobSignalException:
+            if retries <= 0:
+                raise
+            retries -= 1
+
+
+def submit(func: typ.Callable[..., RT], *args: typ.Any) -> "Future[RT]":
+    """Call func(*args) on the worker pool.
+
+    Calls for which a svgbob process crashed are retried. If the
+    pool was shut down in the meantime (for example by
+    set_pool_size in another thread), a new pool is created.
+    """
+    pool = get_pool()
+    try:
+        return pool.submit(_call_with_retry, func, *args)
+    except RuntimeError:
+        # cannot schedule new futures after shutdown
+        with _POOL_LOCK:
+            if _POOL and _POOL[0] is pool:
+                del _POOL[:]
+        return get_pool().submit(_call_with_retry, func, *args)
+
+
+def submit_text2svg(image_text: str, options: Options = None) -> "Future[bytes]":
+    return submit(text2svg, image_text, options)
+
+
+# (digest of each image, cached results, pending inputs by digest)
+Partition = typ.Tuple[typ.List[str], typ.Dict[str, bytes], typ.Dict[str, bytes]]
+
+
+def _partition_cached(
+    image_texts: typ.Sequence[str], backend_id: str, options: typ.Optional[Options]
+) -> Partition:
+    digests: typ.List[str] = []
+    results: typ.Dict[str, bytes] = {}
+    pending: typ.Dict[str, bytes] = {}
+
+    for image_text in image_texts:
+        input_data = image_text.encode("utf-8")
+        digest     = _make_digest(input_data, backend_id, options)
+        digests.append(digest)
+
+        if digest in results or digest in pending:
+            continue
+
+        result = _get_cached_svg(digest)
+        if result is None:
+            pending[digest] = input_data
+        else:
+            results[digest] = result
+
+    return digests, results, pending
+
+
+def _submit_renders(
+    pending    : typ.Dict[str, bytes],
+    backend    : Backend,
+    options    : typ.Optional[Options],
+    max_workers: typ.Optional[int],
+) -> typ.Dict[str, "Future[bytes]"]:
+    futures: typ.Dict[str, "Future[bytes]"] = {}
+    if max_workers is None:
+        for digest, input_data in pending.items():
+            futures[digest] = submit(_render_svg, input_data, backend, options, digest)
+        return futures
+
+    # pylint: disable=import-outside-toplevel ; lazy import to improve startup time
+    from concurrent.futures import ThreadPoolExecutor
+
+    pool = ThreadPoolExecutor(max_workers=max_workers)
+    for digest, input_data in pending.items():
+        futures[digest] = pool.submit(
+            _call_with_retry, _render_svg, input_data, backend, options, digest
+        )
+    # NOTE: submitted renders are still completed after shutdown
+    pool.shutdown(wait=False)
+    return futures
+
+
+def _collect_renders(futures: typ.Dict[str, "Future[bytes]"]) -> typ.Dict[str, bytes]:
+    results = {digest: future.result() for digest, future in futures.items()}
+    for digest, result in results.items():
+        SVG_CACHE.put(digest, result)
+
+    _cleanup_tmp_dir()
+    return results
+
+
+def text2svg_many(
+    image_texts: typ.Sequence[str],
+    options    : Options = None,
+    max_workers: typ.Optional[int] = None,
+) -> typ.List[bytes]:
+    """Render multiple images concurrently.
+
+    Identical inputs are only rendered once and the results
+    are returned in the same order as image_texts. If
+    max_workers is not set, the shared worker pool is used.
+    """
+    backend = get_backend()
+    digests, results, pending = _partition_cached(image_texts, backend.get_id(), options)
+    if pending:
+        futures = _submit_renders(pending, backend, options, max_workers)
+        results.update(_collect_renders(futures))
+
+    return [results[digest] for digest in digests]
@@ -0,0 +1,12 @@
+# This file is part of markdown-svgbob.
+# https://github.com/mbarkhau/markdown-svgbob
+#
+# Copyright (c) 2019 Manuel Barkhau (mbarkhau@gmail.com) - MIT License
+# SPDX-License-Identifier: MIT
+import sys
+
+collect_ignore = []
+
+# markdown_svgbob.aio (and its tests) require python 3.7+
+if sys.version_info < (3, 7):
+    collect_ignore.append("test_svgbob_aio.py")
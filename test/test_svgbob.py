@@ -16,12 +16,21 @@ from __future__ import absolute_import
 from __future__ import unicode_literals
 
 import io
+import os
 import re
+import sys
+import time
+import types
 import textwrap
+import subprocess as sp
 
+import pytest
+import pathlib2 as pl
 import markdown as md
 
 import markdown_svgbob
+import markdown_svgbob.cache as cache
+import markdown_svgbob.process as process
 import markdown_svgbob.wrapper as wrp
 import markdown_svgbob.extension as ext
 
@@ -360,3 +369,670 @@ def test_ignore_non_bob_blocks():
     assert "<pre><code>Literal asciiart" in result_a
     assert re.search(r'<pre><code class="(language-)?python">def randint', result_a)
     assert re.search(r'<pre><code class="(language-)?javascript">function randint', result_a)
+
+
+def test_pool():
+    futures = [wrp.submit_text2svg(BASIC_FIG_TXT) for _ in range(4)]
+    results = [future.result() for future in futures]
+    assert results[0] == markdown_svgbob.text2svg(BASIC_FIG_TXT)
+    assert len(set(results)) == 1
+
+    pool_size = wrp.get_pool_size()
+    try:
+        wrp.set_pool_size(2)
+        assert wrp.get_pool()._max_workers == 2
+        wrp.shutdown_pool()
+        fig_data = wrp.submit_text2svg(BASIC_FIG_TXT).result()
+        assert fig_data == results[0]
+    finally:
+        wrp.set_pool_size(pool_size)
+
+
+def test_text2svg_many():
+    other_fig_txt = BASIC_FIG_TXT.replace("+", "*")
+    image_texts   = [BASIC_FIG_TXT, other_fig_txt, BASIC_FIG_TXT]
+
+    results = markdown_svgbob.text2svg_many(image_texts)
+    assert len(results) == 3
+    assert results[0] == results[2] == markdown_svgbob.text2svg(BASIC_FIG_TXT)
+    assert results[1] == markdown_svgbob.text2svg(other_fig_txt)
+
+    options = {'stroke-width': 4}
+    results = markdown_svgbob.text2svg_many(image_texts, options, max_workers=2)
+    assert results[1] == markdown_svgbob.text2svg(other_fig_txt, options)
+
+
+def test_multiple_blocks():
+    other_block_txt = BASIC_BLOCK_TXT.replace("+", "*")
+    md_text         = "\n\n".join([BASIC_BLOCK_TXT, other_block_txt, "interlude", BASIC_BLOCK_TXT])
+    result          = md.markdown(md_text, extensions=['markdown_svgbob'])
+
+    html_tag       = ext.draw_bob(BASIC_BLOCK_TXT)
+    other_html_tag = ext.draw_bob(other_block_txt)
+    expected       = "".join(
+        [
+            "<p>{}</p>".format(html_tag),
+            "<p>{}</p>".format(other_html_tag),
+            "<p>interlude</p>",
+            "<p>{}</p>".format(html_tag),
+        ]
+    )
+    assert result.replace("\n", "") == expected
+
+
+def test_memory_cache():
+    mem_cache = cache.MemoryCache(max_entries=2, max_bytes=10)
+    mem_cache.put("a", b"aaaa")
+    mem_cache.put("b", b"bbbb")
+    assert mem_cache.get("a") == b"aaaa"
+    mem_cache.put("c", b"cccc")
+    assert "b" not in mem_cache
+    assert mem_cache.get("b") is None
+    assert len(mem_cache) == 2
+
+    mem_cache.put("d", b"dddddd")
+    assert "a" not in mem_cache
+    assert "c" in mem_cache
+    assert mem_cache.nbytes == 10
+    mem_cache.put("e", b"e" * 11)
+    assert "e" not in mem_cache
+    assert mem_cache.stats() == {'entries': 2, 'bytes': 10, 'hits': 1, 'misses': 1}
+
+    wrp.SVG_CACHE.clear()
+    fig_data = markdown_svgbob.text2svg(BASIC_FIG_TXT)
+    assert wrp.SVG_CACHE.misses == 1
+    assert markdown_svgbob.text2svg(BASIC_FIG_TXT) == fig_data
+    assert wrp.SVG_CACHE.hits == 1
+
+
+def test_cache_evictor(tmpdir):
+    cache_dir = pl.Path(str(tmpdir))
+    evictor   = cache.CacheEvictor(cache_dir, max_entries=2)
+
+    entry_dir = cache_dir / "ab" / "cd"
+    entry_dir.mkdir(parents=True)
+
+    # files which are not cache entries are never evicted
+    other_fpaths = [cache_dir / "notes.txt", cache_dir / "ab" / "cd" / "notes.txt"]
+
+    fpaths = [entry_dir / "abcd{}.svg".format(i) for i in range(4)]
+    for i, fpath in enumerate(fpaths + other_fpaths):
+        with fpath.open(mode="wb") as fobj:
+            fobj.write(b"x" * 10)
+        mtime = time.time() - 100 + i
+        os.utime(str(fpath), (mtime, mtime))
+
+    evictor.touch(fpaths[0], 10)
+    evictor.maybe_evict()
+    assert sorted(entry_dir.iterdir()) == [fpaths[0], fpaths[3], other_fpaths[1]]
+
+    # within interval, nothing is evicted
+    evictor.limits.max_entries = 1
+    evictor.maybe_evict()
+    assert len(list(entry_dir.iterdir())) == 3
+
+    evictor.limits.max_entries = None
+    evictor.limits.max_bytes   = 5
+    evictor.evict()
+    assert list(entry_dir.iterdir()) == [other_fpaths[1]]
+    assert other_fpaths[0].exists()
+
+
+def test_disk_cache(tmpdir):
+    cache_dir  = pl.Path(str(tmpdir))
+    disk_cache = cache.DiskCache(cache_dir)
+    key        = "abcdef0123"
+
+    assert disk_cache.get(key) is None
+    disk_cache.put(key, b"<svg></svg>")
+    assert disk_cache.path(key) == cache_dir / "ab" / "cd" / (key + ".svg")
+    assert disk_cache.get(key) == b"<svg></svg>"
+
+    gz_cache = cache.DiskCache(cache_dir, compress=True)
+    gz_cache.put(key, b"<svg></svg>")
+    assert gz_cache.path(key).name == key + ".svg.gz"
+    assert gz_cache.get(key) == b"<svg></svg>"
+
+    # no temporary files are left behind
+    assert sorted(fpath.name for fpath in (cache_dir / "ab" / "cd").iterdir()) == [
+        key + ".svg",
+        key + ".svg.gz",
+    ]
+
+    # an empty file (e.g. created by touch after an eviction) is not a hit
+    empty_key = "abcdef4567"
+    disk_cache.path(empty_key).touch()
+    assert disk_cache.get(empty_key) is None
+
+    orig_disk_cache = wrp.DISK_CACHE
+    try:
+        wrp.set_cache_dir(cache_dir / "svgbob")
+        wrp.SVG_CACHE.clear()
+        fig_data = markdown_svgbob.text2svg(BASIC_FIG_TXT)
+        # cache entries are written in the background
+        wrp.flush_disk_cache()
+        svg_fpaths = list((cache_dir / "svgbob").glob("*/*/*.svg"))
+        assert len(svg_fpaths) == 1
+        assert svg_fpaths[0].read_bytes() == fig_data
+
+        # a failed write is logged, not raised
+        (cache_dir / "svgbob" / "fa").write_bytes(b"")
+        wrp.put_disk_cache_async("fa11ed", b"<svg></svg>")
+        wrp.flush_disk_cache()
+        assert not wrp.DISK_CACHE.path("fa11ed").exists()
+    finally:
+        wrp.DISK_CACHE = orig_disk_cache
+
+
+def test_cache_key():
+    cmd_parts  = wrp.get_bin_cmd()
+    backend_id = wrp.get_backend().get_id()
+    input_data = BASIC_FIG_TXT.encode("utf-8")
+
+    digest = wrp._make_digest(input_data, backend_id, {'stroke-width': 2, 'scale': 1})
+    assert digest == wrp._make_digest(input_data, backend_id, {'scale': 1, '--stroke-width': 2})
+    assert digest != wrp._make_digest(input_data, backend_id, {'scale': 1, 'stroke-width': 3})
+    assert digest != wrp._make_digest(input_data, backend_id)
+
+    # the key doesn't depend on the path of the binary
+    assert wrp._get_bin_id(cmd_parts[0]) == wrp._get_bin_id(os.path.realpath(cmd_parts[0]))
+
+
+def test_bin_cache(monkeypatch):
+    bin_cmd = wrp.get_bin_cmd()
+    try:
+        monkeypatch.setenv('MDSVGBOB_BIN', "/path/to/svgbob")
+        assert wrp.get_bin_cmd() == bin_cmd
+        wrp.reset_bin_cache()
+        assert wrp.get_bin_cmd() == ["/path/to/svgbob"]
+    finally:
+        monkeypatch.delenv('MDSVGBOB_BIN')
+        wrp.reset_bin_cache()
+
+    assert wrp.get_bin_cmd() == bin_cmd
+
+    bin_id = wrp.get_bin_id()
+    assert wrp._BIN_ID == [bin_id]
+    wrp.reset_bin_cache()
+    assert wrp._BIN_ID == []
+    assert wrp.get_bin_id() == bin_id
+
+    options = wrp.parse_options()
+    wrp.reset_bin_cache()
+    assert wrp._get_cmd_options() == wrp._parse_options_help_text(wrp._get_cmd_help_text())
+    assert wrp.parse_options() == options
+
+
+def test_bin_cache_concurrent(monkeypatch):
+    # pylint:disable=import-outside-toplevel
+    from concurrent.futures import ThreadPoolExecutor
+
+    find_bin_cmd = wrp._find_bin_cmd
+
+    def _slow_find_bin_cmd():
+        time.sleep(0.01)
+        return find_bin_cmd()
+
+    bin_cmd = wrp.get_bin_cmd()
+    monkeypatch.setattr(wrp, '_find_bin_cmd', _slow_find_bin_cmd)
+    wrp.reset_bin_cache()
+    try:
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            futures = [pool.submit(wrp.get_bin_id) for _ in range(8)]
+            bin_ids = {future.result() for future in futures}
+        assert len(bin_ids) == 1
+        assert wrp.get_bin_cmd() == bin_cmd
+    finally:
+        wrp.reset_bin_cache()
+
+
+def test_lazy_options():
+    extension = ext.SvgbobExtension()
+    assert set(extension.config) == set(ext.DEFAULT_CONFIG)
+
+    extension = ext.SvgbobExtension(**{'stroke-width': 3})
+    assert extension.getConfig('stroke-width') == 3
+    assert set(extension.config) >= set(wrp.parse_options())
+
+
+def test_postprocess_svg():
+    svg_data = (
+        b'<svg><style>rect.backdrop { fill: white; } .fg_stroke { stroke: black; }'
+        b' .bg_fill { fill: white; } text { fill: black; }</style><rect fill="white"/></svg>'
+    )
+    assert ext._postprocess_svg(svg_data) == svg_data
+    assert ext._postprocess_svg(svg_data, "red", "green") == (
+        b'<svg><style>rect.backdrop { fill: red; } .fg_stroke { stroke: green; }'
+        b' .bg_fill { fill: red; } text { fill: green; }</style><rect fill="red"/></svg>'
+    )
+    assert ext._postprocess_svg(svg_data, bg_color="red").count(b"black") == 2
+    assert ext._postprocess_svg(svg_data, fg_color="green").count(b"white") == 3
+
+
+def test_html_cache():
+    ext.HTML_CACHE.clear()
+    wrp.SVG_CACHE.clear()
+
+    html_tag = ext.draw_bob(BASIC_BLOCK_TXT, {'bg_color': "red"})
+    assert ext.HTML_CACHE.misses == 1
+    assert html_tag == ext._draw_bob(BASIC_BLOCK_TXT, {'bg_color': "red"})[0]
+
+    assert ext.draw_bob(BASIC_BLOCK_TXT, {'bg_color': "red"}) == html_tag
+    assert ext.HTML_CACHE.hits == 1
+
+    assert ext.draw_bob(BASIC_BLOCK_TXT, {'bg_color': "blue"}) != html_tag
+    assert ext.HTML_CACHE.misses == 2
+
+    # from the disk cache
+    ext.HTML_CACHE.clear()
+    wrp.SVG_CACHE.clear()
+    assert ext.draw_bob(BASIC_BLOCK_TXT, {'bg_color': "red"}) == html_tag
+    assert wrp.SVG_CACHE.misses == 0
+
+
+def test_html_cache_version(monkeypatch):
+    cache_key = ext._html_cache_key(BASIC_BLOCK_TXT)
+    monkeypatch.setattr(ext, 'HTML_CACHE_VERSION', ext.HTML_CACHE_VERSION + "-next")
+    assert ext._html_cache_key(BASIC_BLOCK_TXT) != cache_key
+
+
+def test_postprocessor_markers(caplog):
+    extension = ext.SvgbobExtension()
+    postproc  = ext.SvgbobPostprocessor(md.Markdown(), extension)
+
+    marker_a = ext._make_marker_tag(ext.make_marker_id("a"))
+    marker_b = ext._make_marker_tag(ext.make_marker_id("b"))
+    marker_c = ext._make_marker_tag(ext.make_marker_id("c"))
+    extension.images[marker_a] = "<p>A</p>"
+    extension.images[marker_b] = "<p>B</p>"
+    extension.images[marker_c] = "<p>C</p>"
+
+    text   = "<p>" + marker_a + "</p>\n" + marker_b + "\n<p>" + marker_a + "</p><p>" + marker_b
+    result = postproc.run(text)
+    assert result == "<p>A</p>\n<p>B</p>\n<p>A</p><p><p>B</p>"
+    assert marker_c in caplog.text
+    assert marker_a not in caplog.text
+
+
+def test_dedup_svg():
+    md_text = "\n\n".join([BASIC_BLOCK_TXT, "interlude", BASIC_BLOCK_TXT])
+
+    result = md.markdown(md_text, extensions=['markdown_svgbob'])
+    assert result.count("<style") == 2
+
+    result = md.markdown(
+        md_text,
+        extensions=['markdown_svgbob'],
+        extension_configs={'markdown_svgbob': {'dedup_svg': True}},
+    )
+    assert result.count("<style") == 1
+    assert result.count("</svg>") == 2
+    svg_id = re.search(r'<svg id="(svgbob[0-9a-f]+)"', result).group(1)
+    assert '<use href="#{}"/>'.format(svg_id) in result
+
+
+def test_img_file(tmpdir):
+    img_dir = str(tmpdir)
+    options = {'tag_type': "img_file", 'img_dir': img_dir, 'img_url': "/assets/bob/"}
+
+    html_tag = ext.draw_bob(BASIC_BLOCK_TXT, options)
+    img_re   = r'<img class="bob" src="/assets/bob/(\w+\.svg)"[^>]* loading="lazy"/>'
+    match    = re.match(img_re, html_tag)
+    assert match
+    fpath = pl.Path(img_dir) / match.group(1)
+    assert fpath.read_bytes().startswith(b"<svg")
+    assert ' width="' in html_tag
+
+    # the file is written again if it was removed
+    fpath.unlink()
+    assert ext.draw_bob(BASIC_BLOCK_TXT, options) == html_tag
+    assert fpath.exists()
+
+
+def test_minify_svg():
+    svg_data = (
+        b'<svg width="104.000000"><style>\n  line {\n    stroke: black;\n  }\n</style>'
+        b'<line x1="4.123456" y1="-0.0001" x2="8.5"></line><text x="1.005">3.14159</text></svg>'
+    )
+    assert ext._minify_svg(svg_data) == (
+        b'<svg width="104"><style>line{stroke:black;}</style>'
+        b'<line x1="4.12" y1="0" x2="8.5"></line><text x="1">3.14159</text></svg>'
+    )
+
+    # only coordinates and sizes are rounded
+    svg_data = b'<svg version="1.0" width="100.50"><path d="M 1.004 2.5 L 3 4"/></svg>'
+    assert ext._minify_svg(svg_data) == (
+        b'<svg version="1.0" width="100.5"><path d="M 1 2.5 L 3 4"/></svg>'
+    )
+
+    precision = ext.MINIFY_PRECISION
+    try:
+        ext.MINIFY_PRECISION = 0
+        assert ext._minify_svg(b'<svg width="100.0" height="99.6"></svg>') == (
+            b'<svg width="100" height="100"></svg>'
+        )
+    finally:
+        ext.MINIFY_PRECISION = precision
+
+    other_block_txt = BASIC_BLOCK_TXT.replace("+", "*")
+    md_text         = "\n\n".join([BASIC_BLOCK_TXT, "interlude", other_block_txt])
+
+    result = md.markdown(md_text, extensions=['markdown_svgbob'])
+    assert result.count("<style") == 2
+
+    result_min = md.markdown(
+        md_text,
+        extensions=['markdown_svgbob'],
+        extension_configs={'markdown_svgbob': {'minify': True}},
+    )
+    assert result_min.count("<style") == 1
+    assert result_min.count("</svg>") == 2
+    assert len(result_min) < len(result)
+
+
+def test_render_stream():
+    other_block_txt = BASIC_BLOCK_TXT.replace("+", "*")
+    md_text         = "\n\n".join(
+        [
+            "# Title",
+            BASIC_BLOCK_TXT,
+            other_block_txt,
+            "interlude",
+            BASIC_BLOCK_TXT,
+            "```bob\nunterminated",
+        ]
+    )
+    html_tag       = ext.draw_bob(BASIC_BLOCK_TXT)
+    other_html_tag = ext.draw_bob(other_block_txt)
+    expected       = "\n\n".join(
+        [
+            "# Title",
+            html_tag,
+            other_html_tag,
+            "interlude",
+            html_tag,
+            "```bob\nunterminated",
+        ]
+    )
+
+    for max_pending in [None, 1]:
+        out_fobj   = io.StringIO()
+        num_blocks = markdown_svgbob.render_stream(
+            io.StringIO(md_text), out_fobj, max_pending=max_pending
+        )
+        assert num_blocks == 3
+        assert out_fobj.getvalue() == expected
+
+
+def test_limits(monkeypatch):
+    limits     = wrp.get_limits()
+    image_text = BASIC_BLOCK_TXT + "\n{}".format(time.time())
+    try:
+        wrp.set_limits(max_input_bytes=10)
+        with pytest.raises(wrp.SvgbobLimitException, match="max_input_bytes"):
+            wrp.text2svg(image_text)
+
+        wrp.set_limits(max_input_bytes=None, timeout=0.000001)
+        with pytest.raises(wrp.SvgbobTimeoutException):
+            wrp.text2svg(image_text)
+
+        # python2 has no timeout for communicate
+        monkeypatch.delattr(sp, 'TimeoutExpired')
+        with pytest.raises(wrp.SvgbobTimeoutException):
+            wrp.text2svg(image_text)
+        monkeypatch.undo()
+
+        with pytest.raises(KeyError):
+            wrp.set_limits(max_memory=1)
+    finally:
+        wrp.set_limits(**limits)
+
+    assert wrp.text2svg(image_text)
+
+
+def test_default_limits(monkeypatch):
+    monkeypatch.setenv('MDSVGBOB_TIMEOUT', "10s")
+    monkeypatch.setenv('MDSVGBOB_MAX_INPUT_BYTES', "1000")
+    monkeypatch.setenv('MDSVGBOB_MAX_CPU_SECONDS', "0")
+    limits = process._default_limits()
+    assert limits['timeout'] == process.DEFAULT_LIMITS['timeout']
+    assert limits['max_input_bytes'] == 1000
+    assert limits['max_cpu_seconds'] is None
+
+
+def test_large_input():
+    # larger than the pipe buffers, which used to risk a deadlock
+    line       = "+" + "-" * 200 + "+\n"
+    image_text = "".join(line for _ in range(500)) + "{}\n".format(time.time())
+    svg_data   = wrp.text2svg(image_text)
+    assert len(image_text) > 64 * 1024
+    assert svg_data.startswith(b"<svg")
+    assert svg_data.rstrip().endswith(b"</svg>")
+
+
+def test_module_backend(monkeypatch):
+    calls  = []
+    module = types.ModuleType("fake_svgbob")
+
+    def _to_svg(text, **settings):
+        calls.append((text, settings))
+        return "<svg>" + text + "</svg>"
+
+    module.to_svg      = _to_svg
+    module.__version__ = "1.0"
+    monkeypatch.setitem(sys.modules, "fake_svgbob", module)
+
+    with pytest.raises(ValueError):
+        wrp.set_backend("nonexistent")
+
+    with pytest.raises(wrp.SvgbobException):
+        wrp.set_backend("module:nonexistent_svgbob_module")
+
+    bin_id  = wrp.get_bin_id()
+    backend = wrp.get_backend()
+    try:
+        wrp.set_backend("module:fake_svgbob")
+        assert wrp.get_backend().get_id() == "module:fake_svgbob:1.0"
+
+        image_text = "x--y {}".format(time.time())
+        svg_data   = wrp.text2svg(image_text, {'stroke-width': 3, 'fill': True})
+        assert svg_data == ("<svg>" + image_text + "</svg>").encode("utf-8")
+        assert calls == [(image_text, {'stroke_width': "3", 'fill': True})]
+
+        # cached
+        assert wrp.text2svg(image_text, {'stroke-width': 3, 'fill': True}) == svg_data
+        assert len(calls) == 1
+    finally:
+        wrp.set_backend(backend)
+
+    # switching the backend doesn't recompute the id of the binary
+    assert wrp.get_bin_id() is bin_id
+
+
+def _has_svgbob_module():
+    try:
+        wrp.ModuleBackend()._get_module()
+        return True
+    except wrp.SvgbobException:
+        return False
+
+
+def test_backend_parity():
+    # pylint:disable=import-outside-toplevel
+    from markdown_svgbob.__main__ import TEST_IMAGE
+
+    if not _has_svgbob_module():
+        pytest.skip("svgbob extension module not installed")
+
+    subprocess_backend = wrp.SubprocessBackend()
+    module_backend     = wrp.ModuleBackend()
+    for image_text in [TEST_IMAGE, BASIC_FIG_TXT]:
+        for options in [None, {'stroke-width': 4}]:
+            input_data = image_text.encode("utf-8")
+            expected   = subprocess_backend.render(input_data, options)
+            assert module_backend.render(input_data, options) == expected
+
+
+def test_manifest(tmpdir):
+    # pylint:disable=import-outside-toplevel
+    import markdown_svgbob.manifest as manifest
+
+    manifest_path = pl.Path(str(tmpdir)) / "manifest.json"
+    block_text    = "```bob\n{}\n{}\n```".format(BASIC_FIG_TXT, time.time())
+    other_block   = block_text.replace("+", "*")
+    md_text       = "\n\n".join([block_text, "interlude", other_block])
+
+    def _convert(page):
+        extension = ext.SvgbobExtension(manifest=str(manifest_path))
+        extension.set_page(page)
+        return md.markdown(md_text, extensions=[extension])
+
+    result = _convert("index.md")
+    report = manifest.get_manifest(manifest_path).report()
+    assert report['rendered'] == 2
+    assert report['reused'  ] == 0
+
+    # only the latest conversion of a page is reported
+    assert _convert("index.md") == result
+    assert _convert("other.md") == result
+    report = manifest.get_manifest(manifest_path).report()
+    assert report['rendered'] == 0
+    assert report['reused'  ] == 4
+    assert sorted(report['pages']) == ["index.md", "other.md"]
+
+    manifest.save_all()
+    loaded = manifest.Manifest(manifest_path)
+    assert sorted(loaded.pages) == ["index.md", "other.md"]
+    assert len(loaded.pages["index.md"]) == 2
+    assert len(loaded.blocks) == 2
+
+    # the report is reset at the end of each build
+    report = manifest.get_manifest(manifest_path).report()
+    assert report == {'rendered': 0, 'reused': 0, 'pages': {}}
+
+
+def test_manifest_without_page(tmpdir, monkeypatch):
+    # pylint:disable=import-outside-toplevel
+    import markdown_svgbob.manifest as manifest
+
+    # blocks are reused across pages, without set_page and
+    # also if the html cache is disabled
+    monkeypatch.setattr(ext, 'HTML_CACHE_ENABLED', False)
+    manifest_path = pl.Path(str(tmpdir)) / "manifest.json"
+    block_text    = "```bob\n{}\n{}\n```".format(BASIC_FIG_TXT, time.time())
+    md_texts      = [block_text.replace("+", "#"), block_text.replace("+", "%")]
+
+    extension = ext.SvgbobExtension(manifest=str(manifest_path))
+    for md_text in md_texts:
+        md.markdown(md_text, extensions=[extension])
+    page_manifest = manifest.get_manifest(manifest_path)
+    assert page_manifest.report()['rendered'] == 2
+
+    manifest.save_all()
+    loaded = manifest.Manifest(manifest_path)
+    assert loaded.pages == {}
+    assert len(loaded.blocks) == 2
+
+    ext.HTML_CACHE.clear()
+    md.markdown(md_texts[0], extensions=[extension])
+    report = page_manifest.report()
+    assert report['rendered'] == 0
+    assert report['reused'  ] == 1
+
+    # blocks which were not used in a build are dropped
+    manifest.save_all()
+    loaded = manifest.Manifest(manifest_path)
+    assert len(loaded.blocks) == 1
+
+
+def test_cli_render(tmpdir, monkeypatch, capsys):
+    # pylint:disable=import-outside-toplevel
+    import markdown_svgbob.__main__ as main
+
+    monkeypatch.chdir(str(tmpdir))
+    docs_dir = pl.Path("docs")
+    (docs_dir / "sub").mkdir(parents=True)
+    (docs_dir / "fig.bob").write_text(BASIC_FIG_TXT)
+    (docs_dir / "sub" / "page.md").write_text(EXTENDED_BLOCK_TXT)
+
+    assert main.main(["render", "docs/**/*.bob", "docs/**/*.md", "--out-dir", "out"]) == 0
+    assert "2 file(s) rendered" in capsys.readouterr().err
+
+    svg_data = pl.Path("out/docs/fig.svg").read_bytes()
+    html     = pl.Path("out/docs/sub/page.html").read_text()
+    assert svg_data == wrp.text2svg(BASIC_FIG_TXT)
+    assert html == md.markdown(EXTENDED_BLOCK_TXT, extensions=['markdown_svgbob'])
+
+    assert main.main(["render", "docs/**/*", "--out-dir", "out"]) == 0
+    assert "0 file(s) rendered, 2 up to date" in capsys.readouterr().err
+
+    # a pattern which matches nothing is not a missing file
+    assert main.main(["render", "docs/**/*.bob", "docs/*.md", "--out-dir", "out"]) == 0
+    assert "0 file(s) rendered, 1 up to date" in capsys.readouterr().err
+    assert main.main(["render", "docs/missing.md"]) == 1
+
+    with pytest.raises(SystemExit):
+        main.main(["render", "docs/**/*.md", "--option", "tag_type"])
+    assert "expected NAME=VALUE" in capsys.readouterr().err
+
+
+def test_cli_watch(tmpdir, monkeypatch):
+    # pylint:disable=import-outside-toplevel
+    import markdown_svgbob.cli as cli
+
+    monkeypatch.chdir(str(tmpdir))
+    md_path     = pl.Path("page.md")
+    html_path   = pl.Path("page.html")
+    other_block = BASIC_BLOCK_TXT.replace("+", "*")
+    md_path.write_text("\n\n".join([BASIC_BLOCK_TXT, "interlude", other_block]))
+
+    watcher = cli.Watcher(["*.md"], debounce=1)
+    assert watcher.poll(now=100) == []
+    reports = watcher.poll(now=101)
+    assert len(reports) == 1
+    assert "2 of 2 diagram(s) rendered" in reports[0]
+    assert html_path.exists()
+    assert watcher.poll(now=102) == []
+
+    changed_block = other_block.replace("*", "#")
+    md_path.write_text("\n\n".join([BASIC_BLOCK_TXT, "interlude", changed_block, "more text"]))
+    os.utime(str(md_path), (200, 200))
+    # debounced
+    assert watcher.poll(now=103) == []
+    reports = watcher.poll(now=104)
+    assert "1 of 2 diagram(s) rendered" in reports[0]
+    assert "more text" in html_path.read_text()
+
+
+def test_metrics():
+    # pylint:disable=import-outside-toplevel
+    import json
+    import markdown_svgbob.metrics as metrics
+
+    calls = []
+    stats = metrics.enable()
+    stats.reset()
+    stats.hooks.append(lambda stage, duration, info: calls.append(stage))
+    try:
+        label      = "label {}".format(time.time())
+        block_text = "```bob\n" + label + "\n" + BASIC_FIG_TXT + "\n```"
+        md_text    = "\n\n".join([block_text, "interlude", block_text])
+        md.markdown(md_text, extensions=['markdown_svgbob'])
+        md.markdown(md_text, extensions=['markdown_svgbob'])
+    finally:
+        metrics.disable()
+        del stats.hooks[:]
+
+    data = json.loads(stats.to_json())
+    for stage in ["preprocessor", "postprocessor", "draw_bob", "render", "svg2html"]:
+        assert stage in data['stages']
+        assert stage in calls
+
+    render_stats = data['stages']['render']
+    assert render_stats['count'] == 1
+    assert render_stats['bytes_in'] > 0
+    assert render_stats['bytes_out'] > 0
+    assert data['slowest'][0]['label'] == label
+    # second conversion is served from the html cache
+    assert data['hit_ratios']['html_cache.memory'] == 0.5
+    stats.reset()
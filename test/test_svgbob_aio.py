@@ -0,0 +1,43 @@
+# This file is part of markdown-svgbob.
+# https://github.com/mbarkhau/markdown-svgbob
+#
+# Copyright (c) 2019 Manuel Barkhau (mbarkhau@gmail.com) - MIT License
+# SPDX-License-Identifier: MIT
+
+# NOTE: This module requires python 3.7+, it is not collected
+#   for older versions (see conftest.py).
+
+import time
+import asyncio
+
+import pytest
+
+import markdown_svgbob.aio as aio
+import markdown_svgbob.wrapper as wrp
+import markdown_svgbob.extension as ext
+
+BASIC_BLOCK_TXT = """```bob
+ .---.
+ | A |--->
+ '---'
+```"""
+
+
+def test_async_text2svg():
+    async def _render():
+        return await asyncio.gather(
+            aio.async_text2svg(BASIC_BLOCK_TXT),
+            aio.async_text2svg(BASIC_BLOCK_TXT),
+            aio.async_draw_bob(BASIC_BLOCK_TXT),
+        )
+
+    wrp.SVG_CACHE.clear()
+    ext.HTML_CACHE.clear()
+    svg_data, svg_data_again, html = asyncio.run(_render())
+    assert svg_data == svg_data_again == wrp.text2svg(BASIC_BLOCK_TXT)
+    assert html == ext.draw_bob(BASIC_BLOCK_TXT)
+
+    image_text = BASIC_BLOCK_TXT + "\n{}".format(time.time())
+    with pytest.raises(aio.SvgbobTimeoutException):
+        asyncio.run(aio.async_text2svg(image_text, timeout=0))
+    assert isinstance(aio.SvgbobTimeoutException(), wrp.SvgbobException)